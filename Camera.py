@@ -10,9 +10,18 @@ import cv2
 import numpy as np
 import time
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from queue import Queue
 from logging import StreamHandler, getLogger, DEBUG, NullHandler
 
+from Scheduler import FrameScheduler, sleep_until
+from Recorder import VideoRecorder, ReplayBuffer
+from FrameSource import isSourceSpec, openSource
+
+_logger = getLogger(__name__)
+
+
 def imwrite(filename: str, img, params=None):
     try:
         ext = os.path.splitext(filename)[1]
@@ -30,99 +39,965 @@ def imwrite(filename: str, img, params=None):
         return False
 
 
+# capture backend names usable in Settings.json (Camera.backend)
+BACKENDS = {
+    "any": cv2.CAP_ANY,
+    "dshow": cv2.CAP_DSHOW,
+    "msmf": cv2.CAP_MSMF,
+    "v4l2": cv2.CAP_V4L2,
+    "gstreamer": cv2.CAP_GSTREAMER,
+    "ffmpeg": cv2.CAP_FFMPEG,
+}
+
+
+def resolveBackend(name="auto"):
+    if name is None or name == "auto":
+        if os.name == 'nt':
+            return cv2.CAP_DSHOW
+        elif sys.platform.startswith('linux'):
+            return cv2.CAP_V4L2
+        return cv2.CAP_ANY
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown capture backend: {name}")
+    return BACKENDS[name]
+
+
+def fourccToStr(value):
+    value = int(value)
+    return "".join(chr((value >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00")
+
+
+def configureCapture(camera, fourcc=None, size=None, fps=None):
+    """
+    Request a capture format and return what the driver actually granted.
+    FOURCC is set first because many drivers only offer high resolutions / frame rates in MJPG.
+    """
+    if fourcc:
+        camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+    if size is not None:
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+    if fps:
+        camera.set(cv2.CAP_PROP_FPS, fps)
+    return {
+        "fourcc": fourccToStr(camera.get(cv2.CAP_PROP_FOURCC)),
+        "width": int(camera.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps": camera.get(cv2.CAP_PROP_FPS),
+    }
+
+
+def measureFps(camera, frames=60, warmup=5):
+    """Read frames as fast as the device delivers them and return the measured rate."""
+    for _ in range(warmup):
+        camera.grab()
+    t = time.perf_counter()
+    delivered = 0
+    for _ in range(frames):
+        if camera.grab():
+            delivered += 1
+    elapsed = time.perf_counter() - t
+    return delivered / elapsed if elapsed > 0 else 0.0
+
+
+def probeModes(source, modes, backend="auto", frames=60, factory=None):
+    """
+    Try every mode (fourcc, width, height, fps) on source and measure the frame rate actually delivered.
+    factory(source, backend) creates the capture object (cv2.VideoCapture by default), so a
+    file-backed or synthetic source can stand in for a device.
+    Returns (best mode or None, [result per mode]); the best mode is the fastest one whose granted
+    size matches the request and whose measured rate reaches 90% of the requested fps.
+    """
+    if factory is None:
+        factory = lambda src, api: cv2.VideoCapture(src, api)
+    api = resolveBackend(backend)
+    results = []
+    for fourcc, width, height, fps in modes:
+        camera = factory(source, api)
+        try:
+            if not camera.isOpened():
+                continue
+            granted = configureCapture(camera, fourcc, (width, height), fps)
+            measured = measureFps(camera, frames)
+        finally:
+            camera.release()
+        results.append({"mode": (fourcc, width, height, fps), "granted": granted, "measured_fps": measured})
+        _logger.debug(f"Probe {fourcc} {width}x{height}@{fps}: granted {granted}, measured {measured:.1f} fps")
+    candidates = [r for r in results
+                  if (r["granted"]["width"], r["granted"]["height"]) == r["mode"][1:3]
+                  and r["measured_fps"] >= 0.9 * r["mode"][3]]
+    best = max(candidates, key=lambda r: r["measured_fps"], default=None)
+    return (best["mode"] if best is not None else None), results
+
+
+class CaptureWriter:
+    """
+    Encodes and writes screenshots on a small thread pool so the caller returns immediately.
+    At most max_pending captures may wait for the pool; further requests are refused (and logged)
+    instead of piling up frames in memory.
+    """
+    EXTENSIONS = {"png": ".png", "jpg": ".jpg", "jpeg": ".jpg", "webp": ".webp"}
+
+    def __init__(self, workers=2, max_pending=16, fmt="png", png_level=3, jpeg_quality=95, webp_quality=95):
+        self.logger = getLogger(__name__)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="CaptureWriter")
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.setFormat(fmt, png_level, jpeg_quality, webp_quality)
+
+    def setFormat(self, fmt="png", png_level=3, jpeg_quality=95, webp_quality=95):
+        fmt = fmt.lower()
+        if fmt not in self.EXTENSIONS:
+            raise ValueError(f"Unsupported capture format: {fmt}")
+        self.ext = self.EXTENSIONS[fmt]
+        if self.ext == ".png":
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, int(png_level)]
+        elif self.ext == ".jpg":
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)]
+        else:
+            self.params = [cv2.IMWRITE_WEBP_QUALITY, int(webp_quality)]
+
+    def submit(self, path, image):
+        """
+        Queue image (which must not be modified afterwards) to be written to path + extension.
+        Returns the full path, or None when too many captures are already pending.
+        """
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.logger.warning(f"Capture dropped, {self.pending} captures pending: {path}")
+                return None
+            self.pending += 1
+        path = path + self.ext
+        self.pool.submit(self._write, path, image, self.params)
+        return path
+
+    def _write(self, path, image, params):
+        try:
+            if imwrite(path, image, params):
+                self.logger.debug(f"Capture succeeded: {path}")
+            else:
+                self.logger.error(f"Capture Failed: {path}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+class FrameRing:
+    """
+    Fixed pool of preallocated frame buffers shared between the capture thread and its consumers.
+    The writer fills slots round-robin and never waits for readers: when a consumer falls behind,
+    its slot is simply overwritten and get() reports it as stale through the sequence number.
+    writable() invalidates the slot before handing it out, so a reader that checks isCurrent()
+    after reading a slot knows whether the writer touched it meanwhile (see snapshot()).
+    """
+
+    def __init__(self, size, shape, dtype=np.uint8):
+        self.size = size
+        self.seq = -1
+        self.mutex = QMutex()
+        self.allocate(shape, dtype)
+
+    def allocate(self, shape, dtype=np.uint8):
+        self.mutex.lock()
+        try:
+            self.shape = tuple(shape)
+            self.buffers = [np.zeros(self.shape, dtype) for _ in range(self.size)]
+            self.seqs = [-1] * self.size
+            # capture perf_counter of the frame in each slot
+            self.timestamps = [0.0] * self.size
+            self.head = -1
+        finally:
+            self.mutex.unlock()
+
+    def writable(self):
+        """Return (slot, buffer) to decode the next frame into; the frame it held is no longer current."""
+        self.mutex.lock()
+        try:
+            slot = (self.head + 1) % self.size
+            self.seqs[slot] = -1
+            return slot, self.buffers[slot]
+        finally:
+            self.mutex.unlock()
+
+    def commit(self, slot, timestamp=None):
+        """Publish the slot filled after writable() and return its sequence number."""
+        self.mutex.lock()
+        try:
+            self.seq += 1
+            self.seqs[slot] = self.seq
+            self.timestamps[slot] = time.perf_counter() if timestamp is None else timestamp
+            self.head = slot
+            return self.seq
+        finally:
+            self.mutex.unlock()
+
+    def get(self, slot, seq):
+        """Return the buffer in slot if it still holds frame seq, otherwise None."""
+        self.mutex.lock()
+        try:
+            if slot >= self.size or self.seqs[slot] != seq:
+                return None
+            return self.buffers[slot]
+        finally:
+            self.mutex.unlock()
+
+    def isCurrent(self, slot, seq):
+        return self.seqs[slot] == seq
+
+    def latest(self):
+        """
+        Return (slot, seq, buffer, capture timestamp) of the newest committed frame, or (-1, -1, None, None).
+        buffer is a view that the writer reuses; check isCurrent(slot, seq) after reading it or use snapshot().
+        """
+        self.mutex.lock()
+        try:
+            if self.head < 0:
+                return -1, -1, None, None
+            return self.head, self.seq, self.buffers[self.head], self.timestamps[self.head]
+        finally:
+            self.mutex.unlock()
+
+    def snapshot(self, view=None):
+        """
+        Return (seq, copy, capture timestamp) of the newest frame, or (-1, None, None).
+        view: optional function selecting the part of the frame to copy (e.g. a crop).
+        A copy the writer may have torn is discarded and taken again from the then newest frame.
+        """
+        for _ in range(self.size):
+            slot, seq, buffer, timestamp = self.latest()
+            if buffer is None:
+                break
+            frame = (buffer if view is None else view(buffer)).copy()
+            if self.isCurrent(slot, seq):
+                return seq, frame, timestamp
+        return -1, None, None
+
+
+class FrameMailbox:
+    """
+    Latest-frame-wins hand-off between the capture thread and the GUI.
+    Only one notification is in flight at a time; frames posted while the GUI is busy
+    replace the pending one and are counted as dropped instead of piling up in the event queue.
+    """
+
+    def __init__(self):
+        self.mutex = QMutex()
+        self.item = None
+        self.pending = False
+        self.posted = 0
+        self.dropped = 0
+        self.displayed = 0
+
+    def post(self, item):
+        """Store item and return True if the consumer has to be notified."""
+        self.mutex.lock()
+        try:
+            if self.item is not None:
+                self.dropped += 1
+            self.item = item
+            self.posted += 1
+            notify = not self.pending
+            self.pending = True
+            return notify
+        finally:
+            self.mutex.unlock()
+
+    def take(self):
+        """Return the newest item (or None) and re-arm notifications."""
+        self.mutex.lock()
+        try:
+            item = self.item
+            self.item = None
+            self.pending = False
+            return item
+        finally:
+            self.mutex.unlock()
+
+    def markDisplayed(self):
+        self.mutex.lock()
+        self.displayed += 1
+        self.mutex.unlock()
+
+    def markDropped(self):
+        self.mutex.lock()
+        self.dropped += 1
+        self.mutex.unlock()
+
+    def counters(self):
+        self.mutex.lock()
+        try:
+            return {"posted": self.posted, "dropped": self.dropped, "displayed": self.displayed}
+        finally:
+            self.mutex.unlock()
+
+
+class PreviewStage:
+    """
+    Downscales and colour-converts frames for the preview on the capture thread.
+    One RGB buffer and one QImage wrapping it are cached per frame ring slot, so the GUI
+    thread only has to turn a small, ready QImage into a pixmap.
+    """
+
+    def __init__(self, count, width, height):
+        self.count = count
+        self.target = (width, height)
+        self.key = None
+        self.size = None
+        self.small = None
+        self.buffers = []
+        self.images = []
+
+    def setTarget(self, width, height):
+        self.target = (width, height)
+
+    def allocate(self, frame_shape):
+        fh, fw = frame_shape[:2]
+        width, height = self.target
+        # keep the aspect ratio like QImage.scaled(..., Qt.KeepAspectRatio)
+        scale = min(width / fw, height / fh)
+        size = (max(1, int(fw * scale)), max(1, int(fh * scale)))
+        self.buffers = [np.zeros((size[1], size[0], 3), np.uint8) for _ in range(self.count)]
+        self.images = [QImage(buf.data, size[0], size[1], 3 * size[0], QImage.Format_RGB888)
+                       for buf in self.buffers]
+        self.small = np.zeros((size[1], size[0], 3), np.uint8)
+        self.size = size
+        self.key = (frame_shape, self.target)
+
+    def process(self, slot, frame):
+        # runs between FrameRing.writable() and commit(), while the slot is not current,
+        # so the GUI's isCurrent() checks reject a preview that is being overwritten
+        if self.key != (frame.shape, self.target):
+            self.allocate(frame.shape)
+        cv2.resize(frame, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2RGB, dst=self.buffers[slot])
+
+    def image(self, slot):
+        """Return (QImage, backing buffer); keep the buffer referenced while using the image."""
+        buffers, images = self.buffers, self.images
+        return images[slot], buffers[slot]
+
+
+class FrameBus:
+    """
+    Publishes frames from every VideoThread of a CaptureManager.
+    Subscribers are called on the publishing capture thread as callback(device, frame, seq, timestamp);
+    frame is a view into that device's frame ring, so callbacks must be quick and copy what they keep.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # device -> [callback]
+        self.subscribers = {}
+        # device -> FrameRing that published last
+        self.rings = {}
+
+    def subscribe(self, device, callback):
+        with self.lock:
+            self.subscribers.setdefault(device, []).append(callback)
+
+    def unsubscribe(self, device, callback):
+        with self.lock:
+            callbacks = self.subscribers.get(device, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def publish(self, device, ring, frame, seq, timestamp):
+        with self.lock:
+            self.rings[device] = ring
+            callbacks = list(self.subscribers.get(device, ()))
+        for callback in callbacks:
+            try:
+                callback(device, frame, seq, timestamp)
+            except Exception as e:
+                _logger.error(f"Frame bus subscriber failed: {e}")
+
+    def latest(self, device):
+        """Return (seq, frame copy, timestamp) of the newest frame from device, or None."""
+        with self.lock:
+            ring = self.rings.get(device)
+        if ring is None:
+            return None
+        seq, frame, timestamp = ring.snapshot()
+        return None if frame is None else (seq, frame, timestamp)
+
+
 class VideoThread(QThread):
     """
     Loading Camera class
     contains ImageProcessing
     """
-    change_pixmap_signal = pyqtSignal(np.ndarray)
+    # a new frame is waiting in self.mailbox
+    change_pixmap_signal = pyqtSignal()
+    # measured fps, mean jitter [ms], max jitter [ms]
+    frame_stats_signal = pyqtSignal(float, float, float)
 
-    def __init__(self, fps, CameraID):
+    def __init__(self, fps, CameraID, capture_size=(1280, 720), bus=None, backend="auto", fourcc=None,
+                 capture_fps=None, source_options=None, probe_modes=None, preview=False):
         super().__init__()
         self.logger = getLogger(__name__)
-        self.logger.addHandler(StreamHandler(sys.stdout))
+        if not self.logger.handlers:
+            # one handler per module, however many cameras are open
+            self.logger.addHandler(StreamHandler(sys.stdout))
 
         self.logger.setLevel(DEBUG)
         self.logger.propagate = True
 
         self.is_paused = False
+        self.is_running = True
+        self.mutex = QMutex()
+        self.condition = QWaitCondition()
+        # bumped by every switchCamera()/kill() so that stale background openers give up
+        self.open_generation = 0
+        self.read_failures = 0
+        # consecutive failed read()s before the camera is considered lost
+        self.max_read_failures = 30
+        self.reconnect_backoff = (0.5, 8.0)
 
         self.CameraID = CameraID
-        self.capture_size = (1280, 720)
+        self.capture_size = tuple(capture_size)
+        # requested capture format; self.granted holds what the driver actually delivers
+        self.backend = backend
+        self.fourcc = fourcc
+        self.capture_fps = capture_fps
+        self.granted = None
+        # candidate (fourcc, width, height, fps) modes measured with probeModes() when a device is first opened;
+        # the fastest one that delivers replaces the requested format
+        self.probe_modes = [tuple(mode) for mode in probe_modes or []]
+        # device -> mode chosen by the probe (None when no candidate delivered)
+        self.probed = {}
+        # realtime / speed / loop for file, image directory and synthetic sources (see FrameSource.openSource)
+        self.source_options = dict(source_options or {})
         self.fps = fps
+        self.scheduler = FrameScheduler(fps)
+        self.stats_interval = 1.0
+        # last reported fps, mean jitter [ms], max jitter [ms]
+        self.frame_stats = (0.0, 0.0, 0.0)
+        self.bus = bus
         self.camera = None
+        # the camera the capture thread is reading from outside the mutex, and cameras swapped out
+        # during that read, which the capture thread releases once the read has returned
+        self.reading = None
+        self.retired = []
         self.temp_cameraID = None
-        self.cv_img = None
+        self.frames = FrameRing(4, (self.capture_size[1], self.capture_size[0], 3))
+        self.mailbox = FrameMailbox()
+        # only the camera shown in the GUI prepares preview images; the others just publish on the bus
+        self.preview = PreviewStage(self.frames.size, 640, 360) if preview else None
         self.capture_dir = "Captures"
+        self.captureWriter = CaptureWriter()
+        # name -> [x, y, w, h], usable as saveCapture(crop="name")
+        self.roi_presets = {}
+        self.record_dir = "Records"
+        self.recorder = None
+        self.replay = None
 
     def run(self):
         # capture from web cam
-        while True:
-            if not self.is_paused:
-                if self.camera is not None and self.camera.isOpened():
-                        ret, self.cv_img = self.camera.read()
-                        if ret:
-                            self.change_pixmap_signal.emit(self.cv_img)
-                        self.busy_wait(1 / np.float64(self.fps))
+        stats_time = time.perf_counter()
+        frames = 0
+        while self.is_running:
+            self.mutex.lock()
+            try:
+                if self.is_paused or not self.isCameraReady():
+                    # nothing to capture: sleep until resume(), a camera swap or kill() wakes us
+                    self.condition.wait(self.mutex)
+                    self.scheduler.reset()
+                    stats_time = time.perf_counter()
+                    frames = 0
+                    continue
+                camera = self.reading = self.camera
+            finally:
+                self.mutex.unlock()
+            # read outside the mutex: a wedged driver must not block kill(), pause() or a camera swap
+            slot, buffer = self.frames.writable()
+            ret, image = camera.read(image=buffer)
+            timestamp = time.perf_counter()
+            self.mutex.lock()
+            self.reading = None
+            retired, self.retired = self.retired, []
+            self.mutex.unlock()
+            if retired:
+                for old in retired:
+                    old.release()
+                if camera in retired:
+                    # swapped out during the read
+                    continue
+            if not ret and not camera.isOpened():
+                # a video file or image directory has ended; wait for the next switchCamera()
+                self.logger.debug(f"Source {self.CameraID} finished")
+            elif not ret:
+                self.read_failures += 1
+                if self.read_failures == self.max_read_failures:
+                    self.logger.warning(f"Camera {self.CameraID} stopped delivering frames, reconnecting")
+                    self.reconnect()
+            if ret:
+                self.read_failures = 0
+                if image is not buffer:
+                    if image.shape != buffer.shape:
+                        # the driver granted another size, so read() could not decode in place
+                        self.logger.debug(f"Frame size changed to {image.shape}, reallocating buffers")
+                        self.frames.allocate(image.shape, image.dtype)
+                        slot, buffer = self.frames.writable()
+                    np.copyto(buffer, image)
+                preview = self.preview
+                if preview is not None:
+                    preview.process(slot, buffer)
+                recorder = self.recorder
+                if recorder is not None:
+                    recorder.put(buffer, timestamp)
+                replay = self.replay
+                if replay is not None:
+                    replay.put(buffer, timestamp)
+                seq = self.frames.commit(slot, timestamp)
+                if self.bus is not None:
+                    self.bus.publish(self.CameraID, self.frames, buffer, seq, timestamp)
+                if preview is not None and self.mailbox.post((slot, seq, timestamp)):
+                    self.change_pixmap_signal.emit()
+                frames += 1
+            if getattr(camera, "paced", True):
+                self.scheduler.wait()
+
+            now = time.perf_counter()
+            if now - stats_time >= self.stats_interval:
+                stats = self.scheduler.stats
+                self.frame_stats = (frames / (now - stats_time), stats.mean * 1000, stats.max * 1000)
+                self.frame_stats_signal.emit(*self.frame_stats)
+                stats.reset()
+                stats_time = now
+                frames = 0
+
+        self.mutex.lock()
+        retired, self.retired = self.retired, []
+        camera, self.camera = self.camera, None
+        self.mutex.unlock()
+        for old in retired + [camera]:
+            if old is not None:
+                old.release()
+
+    @property
+    def cv_img(self):
+        """A copy of the latest captured frame, or None."""
+        return self.frames.snapshot()[1]
+
+    def latestFrame(self):
+        """Return (seq, frame copy, capture perf_counter) of the newest frame, or (-1, None, None)."""
+        return self.frames.snapshot()
 
+    def isCameraReady(self):
+        return self.camera is not None and self.camera.isOpened()
 
+    def openCamera(self, CID):
+        """
+        Open and configure CID; returns None when it can't be opened.
+        CID is a device index, or a video file, image directory or "synthetic" (see FrameSource.openSource).
+        """
+        if isSourceSpec(CID):
+            camera = openSource(CID, fps=self.capture_fps or self.fps, size=self.capture_size,
+                                **self.source_options)
+            if camera is None:
+                return None
+            self.granted = configureCapture(camera)
+            self.logger.debug(f"Opened {camera}: {self.granted['width']}x{self.granted['height']} "
+                              f"@ {self.granted['fps']:.1f} fps")
+            return camera
+        fourcc, size, fps = self.fourcc, self.capture_size, self.capture_fps
+        mode = self.probedMode(CID)
+        if mode is not None:
+            fourcc, size, fps = mode[0], mode[1:3], mode[3]
+        camera = cv2.VideoCapture(int(CID), resolveBackend(self.backend))
+        if not camera.isOpened():
+            camera.release()
+            return None
+        self.granted = configureCapture(camera, fourcc, size, fps)
+        self.logger.debug(f"Camera {CID} granted {self.granted['fourcc']} "
+                          f"{self.granted['width']}x{self.granted['height']} @ {self.granted['fps']:.1f} fps")
+        return camera
 
+    def pacingFps(self, camera):
+        return getattr(camera, "rate", None) or self.fps
+
+    def probedMode(self, CID):
+        """Return the probed mode for device CID (probing it the first time), or None."""
+        if not self.probe_modes:
+            return None
+        if CID not in self.probed:
+            self.logger.debug(f"Probing {len(self.probe_modes)} modes of camera {CID}")
+            best, _ = probeModes(int(CID), self.probe_modes, self.backend)
+            self.probed[CID] = best
+            if best is None:
+                self.logger.warning(f"No probed mode of camera {CID} delivers its fps, using the requested format")
+            else:
+                self.logger.debug(f"Camera {CID}: using probed mode {best[0]} {best[1]}x{best[2]} @ {best[3]} fps")
+        return self.probed[CID]
+
+    def swapCamera(self, camera, CID, generation):
+        """Install an opened camera unless a newer switch or kill() happened meanwhile."""
+        self.mutex.lock()
+        try:
+            if generation != self.open_generation or not self.is_running:
+                old = camera
+                camera = None
+            else:
+                old = self.camera
+                self.camera = camera
+                # a file or synthetic source is paced at its own rate, a device at self.fps
+                self.scheduler.set_fps(self.pacingFps(camera))
+                self.CameraID = CID
+                self.temp_cameraID = CID
+                self.read_failures = 0
+                self.condition.wakeAll()
+            if old is not None and old is self.reading:
+                # the capture thread is inside old.read(); it releases old when the read returns
+                self.retired.append(old)
+                old = None
+        finally:
+            self.mutex.unlock()
+        # releasing a device can take a while, so it is done outside the lock
+        if old is not None:
+            old.release()
+        return camera is not None
+
+    def switchCamera(self, CID, callback=None):
+        """
+        Open CID on a background thread while the current camera keeps streaming,
+        then swap it in atomically. Returns the opener thread.
+        callback(ok) is called on the opener thread once CID is streaming (True) or could not be
+        opened or was superseded by another switch (False).
+        Switching to the current CID (Reload) releases it first if the driver refuses a second handle.
+        """
+        self.mutex.lock()
+        self.open_generation += 1
+        generation = self.open_generation
+        self.mutex.unlock()
+
+        def open_and_swap():
+            t = time.perf_counter()
+            camera = self.openCamera(CID)
+            if camera is None and CID == self.CameraID and generation == self.open_generation:
+                # most drivers refuse a second handle to a device that is still open, so reopen it in place
+                self.logger.debug(f"Camera {CID} is busy, releasing it to reopen")
+                self.detachCamera()
+                camera = self.openCamera(CID)
+            if camera is None:
+                self.logger.error(f"Can't open camera {CID}")
+                ok = False
+            else:
+                if not isSourceSpec(CID):
+                    # make sure the device delivers before the preview switches over
+                    camera.grab()
+                ok = self.swapCamera(camera, CID, generation)
+                if ok:
+                    self.logger.debug(f"Switched to camera {CID} in {time.perf_counter() - t:.2f} s")
+            if callback is not None:
+                callback(ok)
+
+        thread = threading.Thread(target=open_and_swap, daemon=True)
+        thread.start()
+        return thread
+
+    def detachCamera(self):
+        """Take the camera out of the capture loop and release it (after the read in progress, if any)."""
+        self.mutex.lock()
+        try:
+            camera, self.camera = self.camera, None
+            if camera is not None and camera is self.reading:
+                self.retired.append(camera)
+                camera = None
+        finally:
+            self.mutex.unlock()
+        if camera is not None:
+            camera.release()
+
+    def reconnect(self):
+        """
+        Drop the failing camera and reopen the same device with exponential backoff in the background.
+        """
+        self.mutex.lock()
+        self.open_generation += 1
+        generation = self.open_generation
+        lost = self.camera
+        self.camera = None
+        CID = self.CameraID
+        self.mutex.unlock()
+
+        def retry():
+            if lost is not None:
+                lost.release()
+            delay, max_delay = self.reconnect_backoff
+            while self.is_running and generation == self.open_generation:
+                camera = self.openCamera(CID)
+                if camera is not None:
+                    if self.swapCamera(camera, CID, generation):
+                        self.logger.debug(f"Camera {CID} reconnected")
+                    return
+                time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+
+        thread = threading.Thread(target=retry, daemon=True)
+        thread.start()
+        return thread
 
     def reload_camera(self, CID):
+        """Synchronously (re)open self.CameraID."""
         if self.CameraID == self.temp_cameraID:
             return
-        else:
-            if self.camera is not None and self.camera.isOpened():
-                self.camera.release()
-                self.camera = None
-                self.logger.debug(f"Camera released. Now reloading...")
-            try:
-                self.camera = cv2.VideoCapture(self.CameraID, cv2.CAP_DSHOW)
-                self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.capture_size[0])
-                self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.capture_size[1])
-                self.temp_cameraID = self.CameraID
-                self.logger.debug(f"Done loading camera {CID}")
-            except Exception as e:
-                self.logger.error(e)
+        self.mutex.lock()
+        self.open_generation += 1
+        generation = self.open_generation
+        self.mutex.unlock()
+        camera = self.openCamera(self.CameraID)
+        if camera is None:
+            self.logger.error(f"Can't open camera {CID}")
+            return
+        if self.swapCamera(camera, self.CameraID, generation):
+            self.logger.debug(f"Done loading camera {CID}")
 
+    def cropRegion(self, frame, crop, crop_ax):
+        """
+        Return a view of frame for the requested region.
+        crop: None (full frame), 1 (crop_ax = [x1, y1, x2, y2]), 2 (crop_ax = [x, y, w, h])
+        or the name of an ROI preset ([x, y, w, h]).
+        """
+        if crop is None:
+            return frame
+        if isinstance(crop, str) and not crop.isdigit():
+            if crop not in self.roi_presets:
+                raise ValueError(f"Unknown ROI preset: {crop}")
+            x, y, w, h = self.roi_presets[crop]
+            return frame[y:y + h, x:x + w]
+        if int(crop) == 1:
+            return frame[crop_ax[1]:crop_ax[3], crop_ax[0]:crop_ax[2]]
+        elif int(crop) == 2:
+            return frame[crop_ax[1]:crop_ax[1] + crop_ax[3], crop_ax[0]:crop_ax[0] + crop_ax[2]]
+        raise ValueError(f"Unknown crop mode: {crop}")
 
     def saveCapture(self,crop: list[int] = None, crop_ax : list[int] = None, filename: str=None):
-        crop = None
+        """
+        Snapshot the latest frame (or a region of it, see cropRegion) and write it in the background.
+        Returns the path, or None.
+        """
         if crop_ax is None:
             crop_ax = [0, 0, 1280, 720]
 
         dt_now = datetime.datetime.now()
         if filename is None or filename == "":
-            filename = dt_now.strftime('%Y-%m-%d_%H-%M-%S') + ".png"
-        else:
-            filename = filename + ".png"
-        
-        if crop is None:
-            image = self.cv_img
+            filename = dt_now.strftime('%Y-%m-%d_%H-%M-%S')
+
+        try:
+            # the ring slot will be reused by the capture loop, so the writer needs its own copy
+            # (of the region only)
+            _, image, _ = self.frames.snapshot(lambda frame: self.cropRegion(frame, crop, crop_ax))
+        except ValueError as e:
+            self.logger.error(f"Capture Failed :{e}")
+            return None
+        if image is None:
+            self.logger.warning("No frame to capture")
+            return None
+        if image.size == 0:
+            self.logger.error(f"Capture Failed :empty region {crop_ax}")
+            return None
 
         if not os.path.exists(self.capture_dir):
             os.makedirs(self.capture_dir)
             self.logger.debug("Created Capture folder")
         save_path = os.path.join(self.capture_dir, filename)
-        try:
-            imwrite(save_path, image)
-            self.logger.debug(f"Capture succeeded: {save_path}")
-        except cv2.error as e:
-            self.logger.error(f"Capture Failed :{e}")
+        return self.captureWriter.submit(save_path, image)
+
+    def saveBurst(self, count, interval, filename=None, crop=None, crop_ax=None):
+        """
+        Capture count frames every interval seconds on a background thread; returns the thread.
+        Files are named <filename>_001, _002, ...
+        """
+        if filename is None or filename == "":
+            filename = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+
+        def burst():
+            deadline = time.perf_counter()
+            for i in range(count):
+                self.saveCapture(crop, crop_ax, f"{filename}_{i + 1:03d}")
+                deadline += interval
+                sleep_until(deadline)
+
+        thread = threading.Thread(target=burst, daemon=True)
+        thread.start()
+        return thread
+
+    def startRecording(self, codec="mp4v", container="mp4", queue_size=30, drop_policy="oldest", overlay=True):
+        if self.recorder is not None:
+            return self.recorder.path
+        if not os.path.exists(self.record_dir):
+            os.makedirs(self.record_dir)
+            self.logger.debug("Created Record folder")
+        filename = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + "." + container
+        path = os.path.join(self.record_dir, filename)
+        shape = self.frames.shape
+        # the file plays at the rate frames actually arrive, which can be below the requested fps
+        fps = round(self.frame_stats[0], 2) or self.pacingFps(self.camera)
+        recorder = VideoRecorder(path, fps, (shape[1], shape[0]), codec, queue_size, drop_policy, overlay)
+        recorder.start()
+        self.recorder = recorder
+        self.logger.debug(f"Recording started: {path} at {fps:.2f} fps")
+        return path
+
+    def stopRecording(self):
+        recorder = self.recorder
+        if recorder is None:
+            return None
+        self.recorder = None
+        stats = recorder.stop()
+        self.logger.debug(f"Recording stopped: {recorder.path} "
+                          f"(written {stats['written']}, dropped {stats['dropped']}, "
+                          f"encoder latency mean {stats['latency_mean'] * 1000:.1f} ms, "
+                          f"max {stats['latency_max'] * 1000:.1f} ms)")
+        return stats
+
+    def enableReplay(self, seconds=30, budget_mb=256, quality=80):
+        self.disableReplay()
+        replay = ReplayBuffer(seconds, int(budget_mb * 1024 * 1024), quality)
+        replay.start()
+        self.replay = replay
+        self.logger.debug(f"Replay buffer enabled: {seconds} s, {budget_mb} MB")
+
+    def disableReplay(self):
+        replay = self.replay
+        if replay is not None:
+            self.replay = None
+            replay.stop()
+
+    def dumpReplay(self, filename=None, codec="mp4v", container="mp4", callback=None):
+        """Save the replay buffer to the Records folder in the background; returns the path."""
+        if self.replay is None:
+            self.logger.warning("Replay buffer is not enabled")
+            return None
+        if not os.path.exists(self.record_dir):
+            os.makedirs(self.record_dir)
+        if filename is None or filename == "":
+            filename = "replay_" + datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        path = os.path.join(self.record_dir, filename + "." + container)
+        self.replay.dump(path, codec, callback)
+        return path
 
+    def set_fps(self, fps):
+        self.mutex.lock()
+        try:
+            self.fps = float(fps)
+            self.scheduler.set_fps(self.pacingFps(self.camera))
+        finally:
+            self.mutex.unlock()
 
-    def busy_wait(self, dt):
-        current_time = time.perf_counter()
-        while (time.perf_counter() < current_time + dt):
-            pass
-    
     def pause(self):
+        self.mutex.lock()
         self.is_paused = True
-        
+        self.mutex.unlock()
+
     def resume(self):
+        self.mutex.lock()
         self.is_paused = False
-    
-        
-    def kill(self):
+        self.condition.wakeAll()
+        self.mutex.unlock()
+
+    def kill(self, timeout=2000):
+        """
+        Stop the capture loop and wait up to timeout ms for it to return; the capture thread releases
+        the camera on its way out, so a read that is stuck in the driver delays the release, not the caller.
+        """
         self.logger.debug("Kill VideoThread")
-        self.terminate()
\ No newline at end of file
+        self.mutex.lock()
+        self.is_running = False
+        self.open_generation += 1
+        self.condition.wakeAll()
+        self.mutex.unlock()
+        if not self.wait(timeout):
+            self.logger.warning(f"VideoThread {self.CameraID} did not stop within {timeout} ms")
+            return
+        # a thread that never ran still holds its camera
+        self.mutex.lock()
+        camera, self.camera = self.camera, None
+        self.mutex.unlock()
+        if camera is not None:
+            camera.release()
+
+class CaptureManager:
+    """
+    Owns one VideoThread per camera id, each with its own fps, resolution and scheduler,
+    all publishing on one FrameBus.
+    """
+
+    def __init__(self, bus=None):
+        self.logger = getLogger(__name__)
+        self.bus = bus if bus is not None else FrameBus()
+        # guards threads, which switch() remaps from the opener thread
+        self.lock = threading.Lock()
+        self.threads = {}
+
+    def add(self, CameraID, fps=30, capture_size=(1280, 720), backend="auto", fourcc=None, capture_fps=None,
+            source_options=None, probe_modes=None, preview=False):
+        """Start a VideoThread for CameraID; preview=True makes it prepare preview images for the GUI."""
+        with self.lock:
+            if CameraID in self.threads:
+                return self.threads[CameraID]
+            thread = VideoThread(fps, CameraID, capture_size, self.bus, backend, fourcc, capture_fps, source_options,
+                                 probe_modes, preview)
+            self.threads[CameraID] = thread
+        thread.start()
+        # open in the background so a slow device doesn't delay the GUI
+        thread.switchCamera(CameraID)
+        self.logger.debug(f"Camera {CameraID} added ({capture_size[0]}x{capture_size[1]} @ {fps} fps)")
+        return thread
+
+    def get(self, CameraID):
+        with self.lock:
+            return self.threads.get(CameraID)
+
+    def switch(self, CameraID, new_CameraID):
+        """
+        Hot-swap the thread of CameraID over to device new_CameraID.
+        The thread is filed under new_CameraID once the device streams; if it can't be opened,
+        the thread keeps its camera and its id.
+        """
+        with self.lock:
+            if new_CameraID in self.threads:
+                self.logger.warning(f"Camera {new_CameraID} is already in use")
+                return None
+            thread = self.threads.get(CameraID)
+        if thread is None:
+            self.logger.warning(f"Camera {CameraID} is not open")
+            return None
+
+        def remap(ok):
+            if not ok:
+                return
+            with self.lock:
+                for key in [key for key, t in self.threads.items() if t is thread]:
+                    del self.threads[key]
+                self.threads[new_CameraID] = thread
+
+        thread.switchCamera(new_CameraID, remap)
+        return thread
+
+    def remove(self, CameraID):
+        with self.lock:
+            thread = self.threads.pop(CameraID, None)
+        if thread is not None:
+            thread.stopRecording()
+            thread.disableReplay()
+            thread.kill()
+            thread.captureWriter.close()
+
+    def stats(self):
+        """Per device: fps, jitter and preview counters."""
+        with self.lock:
+            threads = dict(self.threads)
+        return {cid: {"fps": t.frame_stats[0], "jitter_mean": t.frame_stats[1], "jitter_max": t.frame_stats[2],
+                      **t.mailbox.counters()}
+                for cid, t in threads.items()}
+
+    def stopAll(self):
+        with self.lock:
+            ids = list(self.threads)
+        for CameraID in ids:
+            self.remove(CameraID)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import ast
+import importlib.util
+import os
+import sys
+import threading
+import time
+from logging import getLogger, DEBUG, NullHandler
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from Latency import Cause, CAPTURE_DECISION, tracker
+from Macro import Macro
+from Recognition import TemplateMatcher, BatchMatcher
+
+
+class StopCommand(Exception):
+    """Raised inside a running command when it has been cancelled."""
+
+
+class PythonCommand(Macro):
+    """
+    Base class of the commands in the Commands directory.
+    Subclasses set NAME and implement do(); press / hold / holdEnd / wait come from Macro
+    and double as cancellation and pause points.
+    """
+    NAME = None
+
+    def __init__(self, keyPress, camera=None, matcher=None, batch=None):
+        super().__init__(keyPress)
+        self.camera = camera
+        self.matcher = matcher if matcher is not None else TemplateMatcher()
+        # a BatchMatcher created here (not shared by the GUI) is closed with the command
+        self._owns_batch = batch is None
+        self.batch = batch if batch is not None else BatchMatcher(self.matcher)
+        self._cancel = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+        # set by cancel() and pause() to cut a running sleep short
+        self._wake = threading.Event()
+        # total seconds spent paused; the schedule is shifted by it
+        self.paused = 0.0
+        # (device, seq, capture perf_counter) of the frame last read or matched
+        self.frame_info = None
+        # Latency.Cause of the last decision
+        self.cause = None
+
+    def do(self):
+        raise NotImplementedError
+
+    def latestFrame(self, device=None):
+        """
+        Return a copy of the latest camera frame and remember its id for markDecision(),
+        or None when no frame has been captured.
+        device selects another camera of the CaptureManager by its camera id.
+        """
+        if self.camera is None:
+            return None
+        if device is None or device == self.camera.CameraID:
+            device = self.camera.CameraID
+            seq, frame, timestamp = self.camera.latestFrame()
+        else:
+            latest = self.camera.bus.latest(device) if self.camera.bus is not None else None
+            if latest is None:
+                return None
+            seq, frame, timestamp = latest
+        if frame is None:
+            return None
+        self.frame_info = (device, seq, timestamp)
+        return frame
+
+    def readFrame(self, device=None):
+        """Return a copy of the latest camera frame, or None when no frame has been captured."""
+        return self.latestFrame(device)
+
+    def markDecision(self):
+        """
+        Mark that the command has decided what to do from the frame it read last.
+        The next controller report carries the frame id, so the latency histograms can follow it to the wire.
+        The recognition methods below call this themselves.
+        """
+        if self.frame_info is None:
+            return None
+        decided = time.perf_counter()
+        device, seq, captured = self.frame_info
+        tracker.record(CAPTURE_DECISION, decided - captured)
+        self.cause = Cause(device, seq, captured, decided)
+        self.keyPress.cause = self.cause
+        return self.cause
+
+    def saveCapture(self, filename=None, crop=None, crop_ax=None):
+        """Save the latest frame (or a region, see VideoThread.cropRegion) in the background; returns the path."""
+        if self.camera is None:
+            return None
+        return self.camera.saveCapture(crop, crop_ax, filename)
+
+    def saveReplay(self, filename=None):
+        """Save the camera's replay buffer (the last N seconds) in the background; returns the path."""
+        if self.camera is None:
+            return None
+        return self.camera.dumpReplay(filename)
+
+    def matchTemplate(self, name, roi=None):
+        """Match a template from the Template directory against the latest frame (see Recognition.MatchResult)."""
+        frame = self.latestFrame()
+        if frame is None:
+            return None
+        result = self.matcher.match(frame, name, roi)
+        self.markDecision()
+        return result
+
+    def isContainTemplate(self, name, threshold=0.7, roi=None):
+        result = self.matchTemplate(name, roi)
+        return result is not None and result.score >= threshold
+
+    def matchTemplates(self, names=None):
+        """
+        Match several templates against the same latest frame in one pass.
+        Templates are registered with self.batch.register(name, roi); names selects a subset.
+        """
+        frame = self.latestFrame()
+        if frame is None:
+            return {}
+        results = self.batch.matchAll(frame, names)
+        self.markDecision()
+        return results
+
+    def whichTemplate(self, names=None, threshold=0.7):
+        """Return the best matching registered template above threshold, or None."""
+        frame = self.latestFrame()
+        if frame is None:
+            return None
+        name = self.batch.best(frame, threshold, names)
+        self.markDecision()
+        return name
+
+    def close(self):
+        """Drop the templates this command registered and release what it owns; called when it ends."""
+        self.batch.clear()
+        if self._owns_batch:
+            self.batch.close()
+
+    def cancel(self):
+        self._cancel.set()
+        self._resume.set()
+        self._wake.set()
+
+    def pause(self):
+        self._resume.clear()
+        self._wake.set()
+
+    def resume(self):
+        self._resume.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def is_paused(self):
+        return not self._resume.is_set()
+
+    def checkpoint(self):
+        """
+        Raise StopCommand if cancelled and block while paused.
+        Everything pressed or held is released for the pause and pressed again on resume.
+        The schedule is shifted by the paused time so the step after a pause is not counted as late.
+        """
+        if self._cancel.is_set():
+            raise StopCommand()
+        if not self._resume.is_set():
+            t = time.perf_counter()
+            saved = self.releaseInputs()
+            self._resume.wait()
+            if self._cancel.is_set():
+                raise StopCommand()
+            self.restoreInputs(saved)
+            paused = time.perf_counter() - t
+            self.paused += paused
+            if self.deadline is not None:
+                self.deadline += paused
+
+    def releaseInputs(self):
+        """Release the controller for a pause; returns what restoreInputs() needs to press it again."""
+        saved = self.keyPress.saveState()
+        self.keyPress.releaseAll()
+        return saved
+
+    def restoreInputs(self, saved):
+        self.keyPress.restoreState(saved)
+
+    def sleepUntil(self, deadline):
+        """Sleep until deadline, moved on by any pause meanwhile; returns the lateness."""
+        while True:
+            paused = self.paused
+            self.checkpoint()
+            deadline += self.paused - paused
+            remaining = deadline - time.perf_counter()
+            if remaining <= self.spin:
+                break
+            self._wake.clear()
+            if not self._wake.wait(remaining - self.spin):
+                break
+        return super().sleepUntil(deadline)
+
+
+class CommandLoader:
+    """
+    Finds PythonCommand subclasses in a directory.
+    Files are scanned with ast (no import) and a module is only imported when one of its commands
+    is first used. reload() re-scans and re-imports only the files whose mtime changed.
+    """
+
+    def __init__(self, directory):
+        self.logger = getLogger(__name__)
+        self.logger.addHandler(NullHandler())
+        self.logger.setLevel(DEBUG)
+        self.logger.propagate = True
+
+        self.directory = directory
+        # path -> (mtime, [(NAME, class name)])
+        self.scanned = {}
+        # path -> (mtime, module)
+        self.modules = {}
+        # NAME -> (path, class name)
+        self.commands = {}
+
+    def scanFile(self, path):
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        found = []
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef):
+                continue
+            bases = [b.id if isinstance(b, ast.Name) else getattr(b, 'attr', None) for b in node.bases]
+            if 'PythonCommand' not in bases:
+                continue
+            name = node.name
+            for stmt in node.body:
+                if isinstance(stmt, ast.Assign) and any(getattr(t, 'id', None) == 'NAME' for t in stmt.targets) \
+                        and isinstance(stmt.value, ast.Constant):
+                    name = stmt.value.value
+            found.append((name, node.name))
+        return found
+
+    def reload(self):
+        """Re-scan the directory and return the sorted command names."""
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        paths = set()
+        for entry in sorted(os.listdir(self.directory)):
+            if not entry.endswith('.py') or entry.startswith('_'):
+                continue
+            path = os.path.join(self.directory, entry)
+            paths.add(path)
+            mtime = os.path.getmtime(path)
+            if path in self.scanned and self.scanned[path][0] == mtime:
+                continue
+            try:
+                self.scanned[path] = (mtime, self.scanFile(path))
+            except SyntaxError as e:
+                self.logger.error(f"Command {entry}: {e}")
+                self.scanned[path] = (mtime, [])
+        for path in set(self.scanned) - paths:
+            del self.scanned[path]
+            self.modules.pop(path, None)
+
+        self.commands = {}
+        for path, (_, found) in self.scanned.items():
+            for name, class_name in found:
+                self.commands[name] = (path, class_name)
+        return sorted(self.commands)
+
+    def load(self, name):
+        """Return the command class called name, importing (or re-importing) its module if needed."""
+        path, class_name = self.commands[name]
+        mtime = self.scanned[path][0]
+        if path not in self.modules or self.modules[path][0] != mtime:
+            module_name = 'Commands.' + os.path.splitext(os.path.basename(path))[0]
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            self.modules[path] = (mtime, module)
+            self.logger.debug(f"Imported {module_name}")
+        return getattr(self.modules[path][1], class_name)
+
+
+class CommandWorker(QThread):
+    """
+    Runs one PythonCommand on its own thread.
+    """
+    # command name, True if it ran to the end
+    finished_signal = pyqtSignal(str, bool)
+
+    def __init__(self, command):
+        super().__init__()
+        self.logger = getLogger(__name__)
+        self.command = command
+        self.name = command.NAME or type(command).__name__
+
+    def run(self):
+        ok = False
+        try:
+            self.logger.info(f"Start command: {self.name}")
+            self.command.do()
+            ok = True
+        except StopCommand:
+            self.logger.info(f"Command cancelled: {self.name}")
+        except Exception as e:
+            self.logger.exception(f"Command {self.name} failed: {e}")
+        finally:
+            try:
+                self.command.keyPress.releaseAll()
+            except Exception as e:
+                self.logger.error(e)
+            self.command.close()
+            self.command.report()
+            tracker.log()
+            self.finished_signal.emit(self.name, ok)
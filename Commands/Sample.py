@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from Command import PythonCommand
+from Keys import Button, Direction
+
+
+class RepeatA(PythonCommand):
+    NAME = "Repeat A"
+
+    def do(self):
+        while True:
+            self.press(Button.A, duration=0.1, wait=0.5)
+
+
+class WalkAround(PythonCommand):
+    NAME = "Walk Around"
+
+    def do(self):
+        while True:
+            self.press(Direction.LEFT, duration=1.0, wait=0.1)
+            self.press(Direction.RIGHT, duration=1.0, wait=0.1)
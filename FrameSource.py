@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+from logging import getLogger, DEBUG, NullHandler
+
+import cv2
+import numpy as np
+
+from Recognition import imread
+
+_logger = getLogger(__name__)
+_logger.addHandler(NullHandler())
+_logger.setLevel(DEBUG)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+class FrameSource:
+    """
+    Stand-in for cv2.VideoCapture that VideoThread can read from instead of a device.
+    Only the calls VideoThread uses are provided: isOpened, read(image=), grab, get, set, release.
+
+    read() never waits: every call returns the next frame. realtime=True behaves like a live camera
+    running at `rate` (fps * speed) frames per second, because VideoThread paces its loop at that rate;
+    realtime=False delivers every frame as fast as it is read and VideoThread stops pacing (see `paced`).
+    When the last frame has been delivered the source closes itself, unless loop is set.
+    """
+
+    def __init__(self, fps=30.0, realtime=True, speed=1.0, loop=False):
+        self.logger = _logger
+
+        if speed <= 0:
+            raise ValueError(f"speed must be positive: {speed}")
+        self.fps = float(fps) if fps and fps > 0 else 30.0
+        self.realtime = realtime
+        self.speed = speed
+        self.loop = loop
+        self.opened = True
+        # index of the next frame to deliver
+        self.index = 0
+
+    @property
+    def paced(self):
+        return self.realtime
+
+    @property
+    def rate(self):
+        """Frames per second to deliver when paced."""
+        return self.fps * self.speed
+
+    @property
+    def size(self):
+        """(width, height) of the frames"""
+        raise NotImplementedError
+
+    @property
+    def count(self):
+        """Number of frames, or None for an endless source."""
+        return None
+
+    def frame(self, index, image):
+        """Return frame index, decoded into image when possible, or None if it can't be read."""
+        raise NotImplementedError
+
+    def read(self, image=None):
+        if not self.opened:
+            return False, None
+        index = self.index
+        count = self.count
+        if count is not None and index >= count:
+            if not self.loop or count == 0:
+                self.logger.debug(f"{self} finished")
+                self.opened = False
+                return False, None
+            index = self.index = 0
+        if image is not None and image.shape != (self.size[1], self.size[0], 3):
+            image = None
+        frame = self.frame(index, image)
+        self.index = index + 1
+        if frame is None:
+            return False, None
+        return True, frame
+
+    def grab(self):
+        return self.read()[0]
+
+    def isOpened(self):
+        return self.opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.size[0])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.size[1])
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.index)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.count if self.count is not None else -1)
+        return 0.0
+
+    def set(self, prop, value):
+        # like a driver that ignores the request; configureCapture reads back what the source has
+        return False
+
+    def release(self):
+        self.opened = False
+
+
+class VideoFileSource(FrameSource):
+    """Plays a video file (e.g. a recording from VideoThread.startRecording)."""
+
+    def __init__(self, path, realtime=True, speed=1.0, loop=False):
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        super().__init__(self.capture.get(cv2.CAP_PROP_FPS), realtime, speed, loop)
+        self.opened = self.capture.isOpened()
+        self._size = (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                      int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        # some containers don't store a frame count; then the file ends when decoding fails
+        self._count = count if count > 0 else None
+        # index of the frame the decoder returns next
+        self.position = 0
+
+    def __str__(self):
+        return f"VideoFileSource({self.path})"
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def count(self):
+        return self._count
+
+    def frame(self, index, image):
+        if index < self.position:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            self.position = index
+        # decoding is sequential, so skipped frames are only grabbed, not retrieved
+        while self.position < index:
+            if not self.capture.grab():
+                break
+            self.position += 1
+        ret, image = self.capture.read(image)
+        if not ret:
+            if self.loop and self.position > 0:
+                self._count = self.position
+            else:
+                self.opened = False
+            return None
+        self.position += 1
+        return image
+
+    def release(self):
+        super().release()
+        self.capture.release()
+
+
+class ImageSequenceSource(FrameSource):
+    """Plays the images of a directory in file name order (e.g. the Captures of a burst)."""
+
+    def __init__(self, directory, fps=30.0, realtime=True, speed=1.0, loop=False):
+        super().__init__(fps, realtime, speed, loop)
+        self.directory = directory
+        self.files = sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+        self._size = (0, 0)
+        if self.files:
+            first = imread(self.files[0])
+            if first is not None:
+                self._size = (first.shape[1], first.shape[0])
+        self.opened = self._size != (0, 0)
+
+    def __str__(self):
+        return f"ImageSequenceSource({self.directory})"
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def count(self):
+        return len(self.files)
+
+    def frame(self, index, image):
+        frame = imread(self.files[index])
+        if frame is None:
+            self.logger.warning(f"Can't read {self.files[index]}")
+            return None
+        if frame.shape[1::-1] != self._size:
+            frame = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+        if image is None:
+            return frame
+        np.copyto(image, frame)
+        return image
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generates a deterministic test pattern: a gradient with a moving bar and the frame number.
+    Frame i is always the same image, so recognition results can be compared between runs.
+    """
+
+    def __init__(self, size=(1280, 720), fps=60.0, realtime=True, speed=1.0, loop=False, count=None):
+        super().__init__(fps, realtime, speed, loop)
+        self._size = tuple(size)
+        self._count = count
+        width, height = self._size
+        self.background = np.empty((height, width, 3), np.uint8)
+        self.background[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)[np.newaxis, :]
+        self.background[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, np.newaxis]
+        self.background[:, :, 2] = 128
+
+    def __str__(self):
+        return f"SyntheticSource({self._size[0]}x{self._size[1]})"
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def count(self):
+        return self._count
+
+    def frame(self, index, image):
+        if image is None:
+            image = np.empty_like(self.background)
+        np.copyto(image, self.background)
+        width, height = self._size
+        bar = max(1, width // 32)
+        x = (index * bar // 4) % (width - bar) if width > bar else 0
+        image[:, x:x + bar] = 255
+        cv2.putText(image, str(index), (10, height - 12), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA)
+        return image
+
+
+def isSourceSpec(spec):
+    """True if spec names a FrameSource rather than a device index."""
+    return isinstance(spec, str) and not spec.isdigit()
+
+
+def openSource(spec, realtime=True, speed=1.0, loop=False, fps=30.0, size=(1280, 720)):
+    """
+    Open the FrameSource named by spec, or return None when it doesn't exist.
+    spec: "synthetic" or "synthetic:WIDTHxHEIGHT", a directory of images, or a video file.
+    fps and size are used by the sources that have none of their own.
+    """
+    if spec.startswith("synthetic"):
+        if ":" in spec:
+            width, height = spec.split(":", 1)[1].lower().split("x")
+            size = (int(width), int(height))
+        return SyntheticSource(size, fps, realtime, speed, loop)
+    if os.path.isdir(spec):
+        source = ImageSequenceSource(spec, fps, realtime, speed, loop)
+    elif os.path.isfile(spec):
+        source = VideoFileSource(spec, realtime, speed, loop)
+    else:
+        return None
+    if not source.isOpened():
+        source.release()
+        return None
+    return source
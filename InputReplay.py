@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+from logging import getLogger, DEBUG, NullHandler
+
+from Command import PythonCommand
+from Keys import encode_binary, BINARY_FRAME, BINARY_FLAG_END, Hat, center
+from Trace import TraceWriter, readTrace
+
+_logger = getLogger(__name__)
+_logger.addHandler(NullHandler())
+_logger.setLevel(DEBUG)
+
+
+class InputRecorder:
+    """
+    Records the controller state transitions made through a KeyPress (GUI buttons, keyboard or a command).
+    Attached as keyPress.recorder, it is called with the new state every time KeyPress sends one and
+    keeps only the states that differ from the previous one. The file is a Trace.py trace, closed by
+    an end record that marks the length of the recording.
+    """
+
+    def __init__(self, path):
+        self.logger = _logger
+
+        self.path = path
+        self.writer = TraceWriter(path)
+        self.last = None
+
+    def record(self, state, timestamp=None):
+        """state: the Keys.ControllerState about to be sent."""
+        values = (int(state.btn), int(state.hat), state.lx, state.ly, state.rx, state.ry)
+        if values == self.last:
+            return
+        self.last = values
+        self.writer.write(*values, 0, timestamp)
+
+    def stop(self):
+        """Close the recording and return the number of transitions."""
+        self.writer.write(0, Hat.CENTER, center, center, center, center, BINARY_FLAG_END)
+        self.writer.close()
+        count = self.writer.count - 1
+        self.logger.debug(f"Recorded {count} input transitions to {self.path}")
+        return count
+
+
+class InputReplay(PythonCommand):
+    """
+    Re-sends a recorded trace through Sender with absolute deadlines.
+    Every event is due at start + (event time / speed); the rows are encoded before the first event,
+    so nothing but the write happens at a deadline. With loop=True the recording is repeated, each
+    pass anchored at the end of the previous one, so the timing does not drift over many loops.
+    The lateness of every event is kept in `errors` (last pass) and `stats` (all passes).
+    """
+    NAME = "Input Replay"
+
+    def __init__(self, keyPress, records, speed=1.0, loop=False, camera=None, matcher=None, batch=None):
+        super().__init__(keyPress, camera, matcher, batch)
+        if speed <= 0:
+            raise ValueError(f"speed must be positive: {speed}")
+        self.speed = speed
+        self.loop = loop
+        self.events = []
+        self.length = 0.0
+        self.errors = []
+        self.passes = 0
+        # the row sent last, pressed again after a pause
+        self.last_row = None
+        self.prepare(records)
+
+    @classmethod
+    def fromFile(cls, keyPress, path, speed=1.0, loop=False, **kwargs):
+        return cls(keyPress, readTrace(path)[1], speed, loop, **kwargs)
+
+    def encode(self, record):
+        send_btn = record.btn << 2 | 0x3
+        if getattr(self.keyPress.ser, 'is_binary', False):
+            return bytes(encode_binary(bytearray(BINARY_FRAME.size), send_btn, record.hat,
+                                       record.lx, record.ly, record.rx, record.ry))
+        # same layout as SendFormat.convert2str with both sticks
+        return f"{send_btn:#06x} {record.hat} {record.lx:x} {record.ly:x} {record.rx:x} {record.ry:x}"
+
+    def prepare(self, records):
+        if not records:
+            return
+        origin = records[0].time
+        for record in records:
+            if record.flags & BINARY_FLAG_END:
+                self.length = record.time - origin
+                break
+            self.events.append((record.time - origin, self.encode(record)))
+        else:
+            self.length = self.events[-1][0] if self.events else 0.0
+
+    def do(self):
+        if not self.events:
+            self.logger.warning("Nothing to replay")
+            return
+        anchor = time.perf_counter()
+        while True:
+            self.errors = []
+            for offset, row in self.events:
+                paused = self.paused
+                error = self.sleepUntil(anchor + offset / self.speed)
+                # a pause moves the rest of the schedule with it
+                anchor += self.paused - paused
+                self.keyPress.ser.writeRow(row)
+                self.last_row = row
+                self.errors.append(error)
+                self.stats.add(error)
+            self.passes += 1
+            if not self.loop:
+                break
+            anchor += self.length / self.speed
+
+    def restoreInputs(self, saved):
+        # the replayed state was written past KeyPress, so it is sent again directly
+        super().restoreInputs(saved)
+        if self.last_row is not None:
+            self.keyPress.ser.writeRow(self.last_row)
+
+    def report(self):
+        summary = self.stats.summary()
+        self.logger.debug(f"Replay: {self.passes} passes of {len(self.events)} events at x{self.speed}, "
+                          f"error mean {summary['mean'] * 1000:.3f} ms, std {summary['std'] * 1000:.3f} ms, "
+                          f"max {summary['max'] * 1000:.3f} ms")
+        return summary
@@ -2,11 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import math
+import struct
+from array import array
+import threading
 import time
-from collections import OrderedDict
 from enum import Enum, IntEnum, IntFlag, auto
 import queue
-from logging import getLogger, DEBUG, NullHandler, StreamHandler
+from functools import wraps
+from logging import getLogger, DEBUG, StreamHandler
 
 
 class Button(IntFlag):
@@ -59,85 +62,190 @@ min = 0
 center = 128
 max = 255
 
+# one logger for the module, shared by every SendFormat and KeyPress
+_logger = getLogger(__name__)
+_logger.setLevel(DEBUG)
+_logger.propagate = True
+
+
+def _moduleLogger():
+    if not _logger.handlers:
+        # added by the first instance rather than at import, so that it writes to the stderr
+        # VController has redirected to the log area by then
+        _logger.addHandler(StreamHandler())
+    return _logger
+
+
+# binary serial frame (see "Binary serial protocol" in README.md)
+# sync, buttons (LE uint16, bit0/1 = R/L stick flags), hat | flags << 4, lx, ly, rx, ry, checksum
+BINARY_FRAME = struct.Struct('<BHBBBBBB')
+BINARY_SYNC = 0xA5
+BINARY_FLAG_END = 0x1
+
+
+def binary_checksum(send_btn, hat_flags, lx, ly, rx, ry):
+    # 8 bit sum of every byte between the sync byte and the checksum
+    return ((send_btn & 0xFF) + (send_btn >> 8) + hat_flags + lx + ly + rx + ry) & 0xFF
+
+
+def encode_binary(buffer, send_btn, hat, lx, ly, rx, ry, flags=0):
+    hat_flags = (int(hat) & 0xF) | (flags << 4)
+    BINARY_FRAME.pack_into(buffer, 0, BINARY_SYNC, send_btn, hat_flags, lx, ly, rx, ry,
+                           binary_checksum(send_btn, hat_flags, lx, ly, rx, ry))
+    return buffer
+
+
+def decode_binary(frame):
+    """
+    Decode a binary frame back into its fields. Raises ValueError for a bad sync byte or checksum.
+    """
+    if len(frame) != BINARY_FRAME.size:
+        raise ValueError(f"Binary frame must be {BINARY_FRAME.size} bytes: {len(frame)}")
+    sync, send_btn, hat_flags, lx, ly, rx, ry, checksum = BINARY_FRAME.unpack(frame)
+    if sync != BINARY_SYNC:
+        raise ValueError(f"Bad sync byte: {sync:#04x}")
+    if checksum != binary_checksum(send_btn, hat_flags, lx, ly, rx, ry):
+        raise ValueError(f"Bad checksum: {checksum:#04x}")
+    return {
+        'btn': send_btn >> 2,
+        'stick_flags': send_btn & 0x3,
+        'hat': Hat(hat_flags & 0xF),
+        'flags': hat_flags >> 4,
+        'lx': lx,
+        'ly': ly,
+        'rx': rx,
+        'ry': ry,
+    }
+
+
+def binary2row(frame):
+    """
+    Render a binary frame in the ASCII row layout (used by Sender.show_input and the serial log).
+    """
+    fields = decode_binary(frame)
+    if fields['flags'] & BINARY_FLAG_END:
+        return 'end'
+    return ' '.join([format(fields['btn'] << 2 | fields['stick_flags'], '#06x'), str(int(fields['hat'])),
+                     format(fields['lx'], 'x'), format(fields['ly'], 'x'),
+                     format(fields['rx'], 'x'), format(fields['ry'], 'x')])
+
+
+class ControllerState:
+    """
+    Buttons, hat and stick values of the controller.
+    The field order needs to be the same as the one written in Joystick.c.
+    Item access (state['lx'], dict(state)) is kept for code written against the former OrderedDict.
+    """
+    __slots__ = ('btn', 'hat', 'lx', 'ly', 'rx', 'ry')
+
+    def __init__(self, btn=0, hat=Hat.CENTER, lx=center, ly=center, rx=center, ry=center):
+        self.btn = btn  # send bit array for buttons
+        self.hat = hat
+        self.lx = lx
+        self.ly = ly
+        self.rx = rx
+        self.ry = ry
+
+    def key(self):
+        """The state as a hashable tuple, for comparing states cheaply."""
+        return self.btn, self.hat, self.lx, self.ly, self.rx, self.ry
+
+    def copy(self):
+        return ControllerState(*self.key())
+
+    def keys(self):
+        return self.__slots__
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __eq__(self, other):
+        return isinstance(other, ControllerState) and self.key() == other.key()
+
+    def __repr__(self):
+        return f"ControllerState(btn={int(self.btn):#06x}, hat={int(self.hat)}, " \
+               f"lx={self.lx}, ly={self.ly}, rx={self.rx}, ry={self.ry})"
+
 
 # serial format
 class SendFormat:
     def __init__(self):
 
-        self.logger = getLogger(__name__)
-        self.logger.addHandler(StreamHandler())
-        self.logger.setLevel(DEBUG)
-        self.logger.propagate = True
-
-        # This format structure needs to be the same as the one written in Joystick.c
-        self.format = OrderedDict([
-            ('btn', 0),  # send bit array for buttons
-            ('hat', Hat.CENTER),
-            ('lx', center),
-            ('ly', center),
-            ('rx', center),
-            ('ry', center),
-        ])
+        self.logger = _moduleLogger()
+
+        self.format = ControllerState()
 
         self.L_stick_changed = False
         self.R_stick_changed = False
         self.Hat_pos = Hat.CENTER
 
+        self.frame = bytearray(BINARY_FRAME.size)
+        # last encodings and the state they were made from; an unchanged state reuses them
+        self._str_key = None
+        self._str = None
+        self._bytes_key = None
+        self._bytes = None
+
     def setButton(self, btns):
         for btn in btns:
-            self.format['btn'] |= btn
+            self.format.btn |= btn
 
     def unsetButton(self, btns):
         for btn in btns:
-            self.format['btn'] &= ~btn
+            self.format.btn &= ~btn
 
     def resetAllButtons(self):
-        self.format['btn'] = 0
+        self.format.btn = 0
 
     def setHat(self, btns):
         # self._logger.debug(btns)
         if not btns:
-            self.format['hat'] = self.Hat_pos
+            self.format.hat = self.Hat_pos
         else:
             self.Hat_pos = btns[0]
-            self.format['hat'] = btns[0]  # takes only first element
+            self.format.hat = btns[0]  # takes only first element
 
     def unsetHat(self):
         # if self.Hat_pos is not Hat.CENTER:
         self.Hat_pos = Hat.CENTER
-        self.format['hat'] = self.Hat_pos
+        self.format.hat = self.Hat_pos
 
     def setAnyDirection(self, dirs):
+        state = self.format
         for dir in dirs:
             if dir.stick == Stick.LEFT:
-                if self.format['lx'] != dir.x or self.format['ly'] != 255 - dir.y:
+                if state.lx != dir.x or state.ly != 255 - dir.y:
                     self.L_stick_changed = True
 
-                self.format['lx'] = dir.x
-                self.format['ly'] = 255 - dir.y  # NOTE: y axis directs under
+                state.lx = dir.x
+                state.ly = 255 - dir.y  # NOTE: y axis directs under
             elif dir.stick == Stick.RIGHT:
-                if self.format['rx'] != dir.x or self.format['ry'] != 255 - dir.y:
+                if state.rx != dir.x or state.ry != 255 - dir.y:
                     self.R_stick_changed = True
 
-                self.format['rx'] = dir.x
-                self.format['ry'] = 255 - dir.y
+                state.rx = dir.x
+                state.ry = 255 - dir.y
 
     def unsetDirection(self, dirs):
+        state = self.format
         if Tilt.UP in dirs or Tilt.DOWN in dirs:
-            self.format['ly'] = center
-            self.format['lx'] = self.fixOtherAxis(self.format['lx'])
+            state.ly = center
+            state.lx = self.fixOtherAxis(state.lx)
             self.L_stick_changed = True
         if Tilt.RIGHT in dirs or Tilt.LEFT in dirs:
-            self.format['lx'] = center
-            self.format['ly'] = self.fixOtherAxis(self.format['ly'])
+            state.lx = center
+            state.ly = self.fixOtherAxis(state.ly)
             self.L_stick_changed = True
         if Tilt.R_UP in dirs or Tilt.R_DOWN in dirs:
-            self.format['ry'] = center
-            self.format['rx'] = self.fixOtherAxis(self.format['rx'])
+            state.ry = center
+            state.rx = self.fixOtherAxis(state.rx)
             self.R_stick_changed = True
         if Tilt.R_RIGHT in dirs or Tilt.R_LEFT in dirs:
-            self.format['rx'] = center
-            self.format['ry'] = self.fixOtherAxis(self.format['ry'])
+            state.rx = center
+            state.ry = self.fixOtherAxis(state.ry)
             self.R_stick_changed = True
 
     # Use this to fix an either tilt to max when the other axis sets to 0
@@ -148,79 +256,128 @@ class SendFormat:
             return 0 if fix_target < center else 255
 
     def resetAllDirections(self):
-        self.format['lx'] = center
-        self.format['ly'] = center
-        self.format['rx'] = center
-        self.format['ry'] = center
+        state = self.format
+        state.lx = center
+        state.ly = center
+        state.rx = center
+        state.ry = center
         self.L_stick_changed = True
         self.R_stick_changed = True
         self.Hat_pos = Hat.CENTER
 
-    def convert2str(self):
-        str_format = ''
-        str_L = ''
-        str_R = ''
-        str_Hat = ''
-        space = ' '
-
-        # set bits array with stick flags
-        send_btn = int(self.format['btn']) << 2
-        # send_btn |= 0x3
-        if self.L_stick_changed:
-            send_btn |= 0x2
-            str_L = format(self.format['lx'], 'x') + space + format(self.format['ly'], 'x')
-        if self.R_stick_changed:
-            send_btn |= 0x1
-            str_R = format(self.format['rx'], 'x') + space + format(self.format['ry'], 'x')
-        # if self.Hat_changed:
-        str_Hat = str(int(self.format['hat']))
-        # format(send_btn, 'x') + \
-        # print(hex(send_btn))
-        str_format = format(send_btn, '#06x') + \
-                     (space + str_Hat) + \
-                     (space + str_L if self.L_stick_changed else '') + \
-                     (space + str_R if self.R_stick_changed else '')
-
+    def clearStickChanges(self):
         self.L_stick_changed = False
         self.R_stick_changed = False
 
-        # print(str_format)
-        return str_format  # the last space is not needed
+    def convert2str(self):
+        key = (self.format.key(), self.L_stick_changed, self.R_stick_changed)
+        if key != self._str_key:
+            state = self.format
+            space = ' '
+            # set bits array with stick flags
+            send_btn = int(state.btn) << 2
+            str_format = space + str(int(state.hat))
+            if self.L_stick_changed:
+                send_btn |= 0x2
+                str_format += space + format(state.lx, 'x') + space + format(state.ly, 'x')
+            if self.R_stick_changed:
+                send_btn |= 0x1
+                str_format += space + format(state.rx, 'x') + space + format(state.ry, 'x')
+            self._str = format(send_btn, '#06x') + str_format
+            self._str_key = key
+
+        self.clearStickChanges()
+        return self._str
+
+    def convert2bytes(self):
+        key = self.format.key()
+        if key != self._bytes_key:
+            state = self.format
+            # A binary frame always carries the full stick state, so both stick flags are set.
+            send_btn = int(state.btn) << 2 | 0x3
+            encode_binary(self.frame, send_btn, state.hat, state.lx, state.ly, state.rx, state.ry)
+            self._bytes = bytes(self.frame)
+            self._bytes_key = key
+
+        self.clearStickChanges()
+        return self._bytes
+
+    def endBytes(self):
+        frame = bytearray(BINARY_FRAME.size)
+        return bytes(encode_binary(frame, 0, Hat.CENTER, center, center, center, center, BINARY_FLAG_END))
+
+
+# Stick positions at full tilt for every whole degree, as computed in stickPosition()
+_FULL_X = array('B', (math.ceil(127.5 * math.cos(math.radians(d)) + 127.5) for d in range(360)))
+_FULL_Y = array('B', (math.floor(127.5 * math.sin(math.radians(d)) + 127.5) for d in range(360)))
+
+
+def stickPosition(angle, magnification=1.0, isDegree=True):
+    """Return the (x, y) stick values (0-255) for angle at magnification."""
+    if isDegree and magnification == 1.0 and -720 <= angle <= 720 and angle == int(angle):
+        degree = int(angle) % 360
+        return _FULL_X[degree], _FULL_Y[degree]
+    angle = math.radians(angle) if isDegree else angle
+    # We set stick X and Y from 0 to 255, so they are calculated as below.
+    # X = 127.5*cos(theta) + 127.5
+    # Y = 127.5*sin(theta) + 127.5
+    return (math.ceil(127.5 * math.cos(angle) * magnification + 127.5),
+            math.floor(127.5 * math.sin(angle) * magnification + 127.5))
+
+
+# interned full-tilt Directions at whole-degree angles (the ones backed by the stickPosition tables),
+# by constructor arguments; other angles and magnitudes are not interned, so sweeping them can't grow this
+_directions = {}
 
 
 # This class handle L stick and R stick at any angles
 class Direction:
-    def __init__(self, stick, angle, magnification=1.0, isDegree=True, showName=None):
-
-        self._logger = getLogger(__name__)
-        self._logger.addHandler(NullHandler())
-        self._logger.setLevel(DEBUG)
-        self._logger.propagate = True
-
-        self.stick = stick
-        self.angle_for_show = angle
-        self.showName = showName
+    """
+    A stick tilt. Instances are immutable, and full tilts at whole-degree angles are interned:
+    Direction(Stick.LEFT, 90) returns the same object every time, so scripts can create them in a loop
+    at no cost.
+    """
+    __slots__ = ('stick', 'angle_for_show', 'mag', 'showName', 'x', 'y')
+
+    def __new__(cls, stick, angle, magnification=1.0, isDegree=True, showName=None):
+        interned = (isDegree and magnification == 1.0 and isinstance(angle, (int, float))
+                    and -720 <= angle <= 720 and angle == int(angle))
+        if interned:
+            key = (stick, angle, showName)
+            self = _directions.get(key)
+            if self is not None:
+                return self
+
+        self = super().__new__(cls)
+        # the attributes are read-only afterwards (see __setattr__)
+        init = object.__setattr__
+        init(self, 'stick', stick)
+        init(self, 'angle_for_show', angle)
         if magnification > 1.0:
-            self.mag = 1.0
+            init(self, 'mag', 1.0)
         elif magnification < 0:
-            self.mag = 0.0
+            init(self, 'mag', 0.0)
         else:
-            self.mag = magnification
+            init(self, 'mag', magnification)
 
         if isinstance(angle, tuple):
             # assuming (X, Y)
-            self.x = angle[0]
-            self.y = angle[1]
-            self.showName = '(' + str(self.x) + ', ' + str(self.y) + ')'
+            init(self, 'x', angle[0])
+            init(self, 'y', angle[1])
+            init(self, 'showName', '(' + str(angle[0]) + ', ' + str(angle[1]) + ')')
             print('押し込み量', self.showName)
         else:
-            angle = math.radians(angle) if isDegree else angle
+            init(self, 'showName', showName)
+            x, y = stickPosition(angle, self.mag, isDegree)
+            init(self, 'x', x)
+            init(self, 'y', y)
+
+        if interned:
+            _directions[key] = self
+        return self
 
-            # We set stick X and Y from 0 to 255, so they are calculated as below.
-            # X = 127.5*cos(theta) + 127.5
-            # Y = 127.5*sin(theta) + 127.5
-            self.x = math.ceil(127.5 * math.cos(angle) * self.mag + 127.5)
-            self.y = math.floor(127.5 * math.sin(angle) * self.mag + 127.5)
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Direction is immutable (tried to set {name})")
 
     def __str__(self):
         if self.mag != 1.0:
@@ -255,6 +412,9 @@ class Direction:
         else:
             return False
 
+    def __hash__(self):
+        return hash((self.stick, self.angle_for_show))
+
     def name(self):
         if self.showName is not None:
             ls = [self.stick, self.angle_for_show, self.showName]
@@ -308,17 +468,29 @@ Direction.R_DOWN_LEFT = Direction(Stick.RIGHT, -135, showName='DOWN_LEFT')
 Direction.R_UP_LEFT = Direction(Stick.RIGHT, 135, showName='UP_LEFT')
 
 
+def _locked(method):
+    """Run a KeyPress method under its lock."""
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
 # handles serial input to Joystick.c
 class KeyPress:
+    """
+    Turns button / hat / stick presses into controller reports sent through ser.
+    The GUI keyboard and buttons and a running command drive it from different threads, so every
+    method that changes or sends the state holds self.lock (reentrant: hold() calls input()).
+    """
     def __init__(self, ser):
 
-        self.logger = getLogger(__name__)
-        self.logger.addHandler(NullHandler())
-        self.logger.setLevel(DEBUG)
-        self.logger.propagate = True
+        self.logger = _moduleLogger()
 
         self.q = queue.Queue()
         self.ser = ser
+        self.lock = threading.RLock()
         self.format = SendFormat()
         self.holdButton = []
         self.btn_name2 = ['LEFT', 'RIGHT', 'UP', 'DOWN', 'UP_LEFT', 'UP_RIGHT', 'DOWN_LEFT', 'DOWN_RIGHT']
@@ -341,12 +513,20 @@ class KeyPress:
         self._pushing = None
         self._chk_neutral = None
         self.NEUTRAL = dict(self.format.format)
+        # state key of the last report sent, and how many identical reports were not sent again
+        self.last_sent = None
+        self.suppressed = 0
+        # Latency.Cause of the next report, set when a command reacts to a camera frame
+        self.cause = None
+        # InputReplay.InputRecorder called with every state sent
+        self.recorder = None
 
         self.input_time_0 = time.perf_counter()
         self.input_time_1 = time.perf_counter()
         self.inputEnd_time_0 = time.perf_counter()
         self.was_neutral = True
 
+    @_locked
     def input(self, btns, ifPrint=True):
         if not isinstance(btns, list):
             btns = [btns]
@@ -380,11 +560,12 @@ class KeyPress:
         self.format.setHat(hats_pressed)
         self.format.setAnyDirection([btn for btn in btns if type(btn) is Direction])
 
-        self.change_key_state_time = self.ser.writeRow(self.format.convert2str())
+        self.change_key_state_time = self.send()
         # print("pressing", self.buttons, self.sticks)
 
         # self._logger.debug(f": {list(map(str,self.format.format.values()))}")
 
+    @_locked
     def inputEnd(self, btns, ifprint=True, unset_hat=True):
         Lstick_change = False
         Rstick_change = False
@@ -435,11 +616,12 @@ class KeyPress:
         self.format.unsetHat()
         self.format.unsetDirection(tilts)
 
-        self.change_key_state_time = self.ser.writeRow(self.format.convert2str())
+        self.change_key_state_time = self.send()
 
         # print("released", btns)
         # print("pressing", self.buttons, self.sticks)
 
+    @_locked
     def hold(self, btns):
         if not isinstance(btns, list):
             btns = [btns]
@@ -447,12 +629,13 @@ class KeyPress:
         for btn in btns:
             if btn in self.holdButton:
                 print('Warning: ' + btn.name + ' is already in holding state')
-                self._logger.warning(f"Warning: {btn.name} is already in holding state")
+                self.logger.warning(f"Warning: {btn.name} is already in holding state")
                 return
 
             self.holdButton.append(btn)
         self.input(btns)
 
+    @_locked
     def holdEnd(self, btns):
         if not isinstance(btns, list):
             btns = [btns]
@@ -462,5 +645,62 @@ class KeyPress:
 
         self.inputEnd(btns)
 
+    @_locked
+    def releaseAll(self):
+        """Release every button, hat and stick (including held ones) and send the neutral state."""
+        self.holdButton = []
+        self.buttons = set([])
+        self.hats = set([])
+        self.format.resetAllButtons()
+        self.format.unsetHat()
+        self.format.resetAllDirections()
+        # always sent, so the controller is neutral even if an earlier report was lost
+        self.change_key_state_time = self.send(force=True)
+
+    @_locked
+    def saveState(self):
+        """Return what is pressed and held now, for restoreState()."""
+        return (self.format.format.copy(), list(self.holdButton), set(self.buttons), set(self.hats),
+                [list(stick) for stick in self.sticks])
+
+    @_locked
+    def restoreState(self, saved):
+        """Press again what saveState() returned (e.g. after releaseAll() for a pause) and send it."""
+        state, self.holdButton, self.buttons, self.hats, self.sticks = saved
+        self.format.format = state.copy()
+        self.format.L_stick_changed = self.format.R_stick_changed = True
+        self.change_key_state_time = self.send(force=True)
+
+    @_locked
+    def send(self, force=False):
+        """Send the current state, unless it is the state that was sent last."""
+        key = self.format.format.key()
+        if key == self.last_sent and not force:
+            self.format.clearStickChanges()
+            self.suppressed += 1
+            return None
+        self.last_sent = key
+        return self.writeRow(self.encode())
+
+    def writeRow(self, row):
+        if self.recorder is not None:
+            self.recorder.record(self.format.format)
+        # the pending cause belongs to the first report sent after the decision
+        cause, self.cause = self.cause, None
+        if cause is None:
+            return self.ser.writeRow(row)
+        return self.ser.writeRow(row, cause=cause)
+
+    def encode(self):
+        if getattr(self.ser, 'is_binary', False):
+            return self.format.convert2bytes()
+        return self.format.convert2str()
+
+    @_locked
     def end(self):
-        self.ser.writeRow('end')
+        self.last_sent = None
+        if getattr(self.ser, 'is_binary', False):
+            self.ser.writeRow(self.format.endBytes())
+        else:
+            self.ser.writeRow('end')
+
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+import time
+from collections import namedtuple
+from logging import getLogger, DEBUG, NullHandler
+
+from Scheduler import RunningStats
+
+_logger = getLogger(__name__)
+_logger.addHandler(NullHandler())
+_logger.setLevel(DEBUG)
+
+# what a controller report was a reaction to: camera id, frame sequence number,
+# capture perf_counter of that frame and the perf_counter when the decision was made
+Cause = namedtuple('Cause', ['device', 'seq', 'captured', 'decided'])
+
+# stages reported by the pipeline
+CAPTURE_DISPLAY = "capture->display"
+CAPTURE_DECISION = "capture->decision"
+DECISION_WIRE = "decision->wire"
+CAPTURE_WIRE = "capture->wire"
+
+# upper bucket bounds in milliseconds; the last bucket is open-ended
+BUCKETS_MS = (0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class LatencyHistogram:
+    """
+    Counts latencies in fixed, roughly logarithmic buckets (see BUCKETS_MS).
+    add() is O(log buckets) and allocation free, so it can be called from the capture and serial threads.
+    """
+
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.stats = RunningStats()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.stats.reset()
+
+    def add(self, seconds):
+        index = bisect.bisect_left(self.bounds, seconds * 1000)
+        with self.lock:
+            self.counts[index] += 1
+            self.stats.add(seconds)
+
+    def percentile(self, p):
+        """Upper bound in ms of the bucket holding the p-th percentile (inf for the open bucket)."""
+        with self.lock:
+            total = sum(self.counts)
+            if total == 0:
+                return 0.0
+            rank = p / 100 * total
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def summary(self):
+        with self.lock:
+            summary = self.stats.summary()
+            counts = list(self.counts)
+        summary.update(p50=self.percentile(50), p90=self.percentile(90), p99=self.percentile(99), buckets=counts)
+        return summary
+
+    def format(self, width=30):
+        """Return the histogram as text, one line per non-empty bucket."""
+        with self.lock:
+            counts = list(self.counts)
+        peak = max(counts) or 1
+        lines = []
+        lower = 0
+        for index, count in enumerate(counts):
+            upper = self.bounds[index] if index < len(self.bounds) else None
+            if count:
+                label = f"{lower:>6g}-{upper:<6g}ms" if upper is not None else f"{lower:>6g}+      ms"
+                lines.append(f"{label} {'#' * max(1, count * width // peak):<{width}} {count}")
+            lower = upper
+        return "\n".join(lines)
+
+
+class LatencyTracker:
+    """
+    One histogram per pipeline stage.
+    The preview records capture->display, recognition records capture->decision and
+    the serial writer records decision->wire and capture->wire for reports that carry a Cause.
+    """
+
+    def __init__(self):
+        self.logger = _logger
+
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def histogram(self, stage):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            return histogram
+
+    def record(self, stage, seconds):
+        self.histogram(stage).add(seconds)
+
+    def recordWire(self, cause, written=None):
+        """Record the stages ending when the report caused by cause has been written to the port."""
+        if written is None:
+            written = time.perf_counter()
+        self.record(DECISION_WIRE, written - cause.decided)
+        self.record(CAPTURE_WIRE, written - cause.captured)
+
+    def reset(self):
+        with self.lock:
+            for histogram in self.histograms.values():
+                histogram.reset()
+
+    def report(self):
+        """Return {stage: summary} for every stage seen so far."""
+        with self.lock:
+            histograms = dict(self.histograms)
+        return {stage: histogram.summary() for stage, histogram in histograms.items()}
+
+    def log(self):
+        with self.lock:
+            histograms = dict(self.histograms)
+        for stage, histogram in histograms.items():
+            summary = histogram.summary()
+            if not summary["count"]:
+                continue
+            self.logger.debug(f"{stage}: {summary['count']} samples, mean {summary['mean'] * 1000:.2f} ms, "
+                              f"p50 <= {summary['p50']:g} ms, p90 <= {summary['p90']:g} ms, "
+                              f"p99 <= {summary['p99']:g} ms, max {summary['max'] * 1000:.2f} ms\n"
+                              f"{histogram.format()}")
+
+
+# shared by the capture threads, the commands and the serial writer
+tracker = LatencyTracker()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+from logging import getLogger, DEBUG, NullHandler
+
+from Scheduler import RunningStats, sleep_until
+
+_logger = getLogger(__name__)
+_logger.addHandler(NullHandler())
+_logger.setLevel(DEBUG)
+
+
+class Macro:
+    """
+    Plays press / hold / wait sequences through KeyPress with drift-free timing.
+    Every step is scheduled against an absolute deadline that advances by exactly the requested
+    duration, so the time spent writing to the serial port and the OS wake-up error of one step
+    are absorbed by the next instead of accumulating over thousands of presses.
+    A step that starts more than max_lag behind (the caller did other work in between) re-anchors
+    the schedule at the current time first, and a press is never released before its duration
+    has passed, even while the schedule is catching up.
+    """
+
+    def __init__(self, keyPress, spin=0.0005, max_lag=0.1):
+        self.logger = _logger
+
+        self.keyPress = keyPress
+        self.spin = spin
+        # re-anchor the schedule when a step starts this much later than planned
+        self.max_lag = max_lag
+        self.deadline = None
+        self._start = None
+        self.stats = RunningStats()
+        self.last_error = 0.0
+        # called as on_step(name, error) after every timed step
+        self.on_step = None
+
+    def start(self):
+        """Anchor the schedule at the current time (also done lazily by the first step)."""
+        self.deadline = time.perf_counter()
+        self._start = self.deadline
+        self.stats.reset()
+
+    def elapsed(self):
+        """Scheduled time since start(), i.e. the sum of every duration and wait so far."""
+        return 0.0 if self.deadline is None else self.deadline - self._start
+
+    def checkpoint(self):
+        """Called before every step sends its input; PythonCommand stops or pauses the command here."""
+
+    def _begin(self, name):
+        """Anchor the schedule for a new step; re-anchor it when the caller fell more than max_lag behind."""
+        self.checkpoint()
+        if self.deadline is None:
+            self.start()
+            return
+        lag = time.perf_counter() - self.deadline
+        if lag > self.max_lag:
+            # the caller was blocked or busy between steps; don't burst through the missed time
+            self.logger.warning(f"{name}: {lag * 1000:.1f} ms behind schedule, re-anchoring")
+            self.stats.missed += 1
+            self.deadline += lag
+
+    def _advance(self, seconds, name, not_before=None):
+        self.deadline += seconds
+        target = self.deadline if not_before is None else max(self.deadline, not_before)
+        error = self.sleepUntil(target)
+        self.stats.add(error)
+        self.last_error = error
+        if self.on_step is not None:
+            self.on_step(name, error)
+        return error
+
+    def sleepUntil(self, deadline):
+        """Sleep until deadline and return the lateness; subclasses may make this interruptible."""
+        return sleep_until(deadline, self.spin)
+
+    def press(self, btns, duration=0.1, wait=0.1):
+        """Press btns for duration seconds, release and wait. Returns the timing error of the release."""
+        self._begin("press")
+        self.keyPress.input(btns)
+        # a late start shortens the wait after the press, never the press itself
+        error = self._advance(duration, "press", time.perf_counter() + duration)
+        self.keyPress.inputEnd(btns)
+        self._advance(wait, "wait")
+        return error
+
+    def hold(self, btns, wait=0.1):
+        self._begin("hold")
+        self.keyPress.hold(btns)
+        return self._advance(wait, "hold")
+
+    def holdEnd(self, btns, wait=0.0):
+        self._begin("holdEnd")
+        self.keyPress.holdEnd(btns)
+        return self._advance(wait, "holdEnd")
+
+    def wait(self, seconds):
+        self._begin("wait")
+        return self._advance(seconds, "wait")
+
+    def report(self):
+        summary = self.stats.summary()
+        self.logger.debug(f"Macro timing: {summary['count']} steps, error mean {summary['mean'] * 1000:.3f} ms, "
+                          f"max {summary['max'] * 1000:.3f} ms, re-anchored {summary['missed']}")
+        return summary
@@ -814,7 +814,7 @@ class Ui_MainWindow(object):
         self.Log.setObjectName("Log")
         self.gridLayout_5 = QtWidgets.QGridLayout(self.Log)
         self.gridLayout_5.setObjectName("gridLayout_5")
-        self.LogArea = QtWidgets.QTextBrowser(self.Log)
+        self.LogArea = QtWidgets.QPlainTextEdit(self.Log)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Preferred)
         sizePolicy.setHorizontalStretch(1)
         sizePolicy.setVerticalStretch(0)
@@ -825,6 +825,8 @@ class Ui_MainWindow(object):
         self.LogArea.setSizeIncrement(QtCore.QSize(1, 0))
         self.LogArea.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.LogArea.setTabStopWidth(80)
+        self.LogArea.setReadOnly(True)
+        self.LogArea.setMaximumBlockCount(5000)
         self.LogArea.setObjectName("LogArea")
         self.gridLayout_5.addWidget(self.LogArea, 0, 0, 1, 1)
         self.horizontalLayout_13 = QtWidgets.QHBoxLayout()
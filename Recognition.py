@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger, DEBUG, NullHandler
+
+import cv2
+import numpy as np
+
+_logger = getLogger(__name__)
+_logger.addHandler(NullHandler())
+_logger.setLevel(DEBUG)
+
+# score in [-1, 1] (TM_CCOEFF_NORMED), top-left corner and size in full-frame pixels
+MatchResult = namedtuple('MatchResult', ['score', 'x', 'y', 'w', 'h'])
+
+
+def imread(filename: str, flags=cv2.IMREAD_COLOR):
+    # cv2.imread can't open non-ASCII paths on Windows (same reason as Camera.imwrite)
+    n = np.fromfile(filename, np.uint8)
+    return cv2.imdecode(n, flags)
+
+
+def toGray(image):
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def buildPyramid(gray, levels):
+    pyramid = [gray]
+    for _ in range(levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+
+class TemplateMatcher:
+    """
+    Template matching over the live camera frame.
+    The search runs on a grayscale image pyramid: the whole region of interest is only scanned at the
+    coarsest level, and every finer level just refines the best location inside a small window.
+    Templates are loaded from template_dir once and cached as grayscale pyramids.
+    """
+
+    def __init__(self, template_dir="Template", levels=2, min_template_size=8, margin=4):
+        self.logger = _logger
+
+        self.template_dir = template_dir
+        self.levels = levels
+        # don't shrink a template below this many pixels on either side
+        self.min_template_size = min_template_size
+        # search window padding (in pixels of the finer level) when refining
+        self.margin = margin
+        # template name -> (mtime, pyramid)
+        self.cache = {}
+
+    def templatePyramid(self, name):
+        path = os.path.join(self.template_dir, name)
+        mtime = os.path.getmtime(path)
+        cached = self.cache.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        template = imread(path, cv2.IMREAD_GRAYSCALE)
+        if template is None:
+            raise ValueError(f"Can't read template: {path}")
+        pyramid = buildPyramid(template, self.levels)
+        self.cache[name] = (mtime, pyramid)
+        return pyramid
+
+    def startLevel(self, image_pyramid, template_pyramid):
+        for level in range(len(template_pyramid) - 1, 0, -1):
+            th, tw = template_pyramid[level].shape[:2]
+            ih, iw = image_pyramid[level].shape[:2]
+            if min(th, tw) >= self.min_template_size and th <= ih and tw <= iw:
+                return level
+        return 0
+
+    def matchPyramid(self, image_pyramid, template_pyramid):
+        """Return (score, (x, y)) of the best match at level 0 of the pyramids."""
+        level = self.startLevel(image_pyramid, template_pyramid)
+        result = cv2.matchTemplate(image_pyramid[level], template_pyramid[level], cv2.TM_CCOEFF_NORMED)
+        _, score, _, loc = cv2.minMaxLoc(result)
+        for level in range(level - 1, -1, -1):
+            image = image_pyramid[level]
+            th, tw = template_pyramid[level].shape[:2]
+            ih, iw = image.shape[:2]
+            x = min(loc[0] * 2, iw - tw)
+            y = min(loc[1] * 2, ih - th)
+            x0 = max(0, x - self.margin)
+            y0 = max(0, y - self.margin)
+            x1 = min(iw, x + tw + self.margin)
+            y1 = min(ih, y + th + self.margin)
+            result = cv2.matchTemplate(image[y0:y1, x0:x1], template_pyramid[level], cv2.TM_CCOEFF_NORMED)
+            _, score, _, loc = cv2.minMaxLoc(result)
+            loc = (x0 + loc[0], y0 + loc[1])
+        return score, loc
+
+    def match(self, frame, name, roi=None):
+        """
+        Match the template file `name` against frame (BGR or grayscale).
+        roi is [x, y, w, h] in frame pixels; the whole frame is searched when it is None.
+        """
+        x, y = 0, 0
+        if roi is not None:
+            x, y, w, h = roi
+            frame = frame[y:y + h, x:x + w]
+        template_pyramid = self.templatePyramid(name)
+        th, tw = template_pyramid[0].shape[:2]
+        if th > frame.shape[0] or tw > frame.shape[1]:
+            raise ValueError(f"Template {name} ({tw}x{th}) is larger than the search area")
+        image_pyramid = buildPyramid(toGray(frame), self.levels)
+        score, loc = self.matchPyramid(image_pyramid, template_pyramid)
+        return MatchResult(score, x + loc[0], y + loc[1], tw, th)
+
+    def isContainTemplate(self, frame, name, threshold=0.7, roi=None):
+        result = self.match(frame, name, roi)
+        self.logger.debug(f"{name}: score {result.score:.3f} at ({result.x}, {result.y})")
+        return result.score >= threshold
+
+
+class BatchMatcher:
+    """
+    Evaluates a registered set of templates against one frame.
+    The frame is converted to grayscale once, one pyramid is built per distinct region of interest,
+    and the templates are matched in a thread pool (cv2.matchTemplate releases the GIL).
+    """
+
+    def __init__(self, matcher, workers=4):
+        self.matcher = matcher
+        # template name -> roi (tuple or None)
+        self.templates = {}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="BatchMatcher")
+
+    def register(self, name, roi=None):
+        self.templates[name] = None if roi is None else tuple(roi)
+
+    def unregister(self, name):
+        self.templates.pop(name, None)
+
+    def clear(self):
+        """Forget every registered template (done when a command ends)."""
+        self.templates.clear()
+
+    def matchAll(self, frame, names=None):
+        """Return {template name: MatchResult} for the registered templates (or only names)."""
+        if names is None:
+            names = list(self.templates)
+        gray = toGray(frame)
+
+        groups = {}
+        for name in names:
+            groups.setdefault(self.templates.get(name), []).append(name)
+
+        futures = {}
+        for roi, group in groups.items():
+            x, y = 0, 0
+            image = gray
+            if roi is not None:
+                x, y, w, h = roi
+                image = gray[y:y + h, x:x + w]
+            image_pyramid = buildPyramid(image, self.matcher.levels)
+            for name in group:
+                # load on this thread; the template cache is not shared with the workers
+                template_pyramid = self.matcher.templatePyramid(name)
+                th, tw = template_pyramid[0].shape[:2]
+                if th > image.shape[0] or tw > image.shape[1]:
+                    raise ValueError(f"Template {name} ({tw}x{th}) is larger than the search area")
+                futures[name] = (self.pool.submit(self.matcher.matchPyramid, image_pyramid, template_pyramid),
+                                 x, y, tw, th)
+
+        results = {}
+        for name, (future, x, y, tw, th) in futures.items():
+            score, loc = future.result()
+            results[name] = MatchResult(score, x + loc[0], y + loc[1], tw, th)
+        return results
+
+    def best(self, frame, threshold=0.7, names=None):
+        """Return the name of the best scoring template above threshold, or None."""
+        results = self.matchAll(frame, names)
+        name = max(results, key=lambda n: results[n].score, default=None)
+        if name is None or results[name].score < threshold:
+            return None
+        return name
+
+    def close(self):
+        self.pool.shutdown(wait=False)
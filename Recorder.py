@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import threading
+import time
+from collections import deque
+from logging import getLogger, DEBUG, NullHandler
+
+import cv2
+import numpy as np
+
+from Scheduler import RunningStats
+
+_logger = getLogger(__name__)
+_logger.addHandler(NullHandler())
+_logger.setLevel(DEBUG)
+
+
+class VideoRecorder(threading.Thread):
+    """
+    Encodes frames handed over by VideoThread with cv2.VideoWriter on its own thread.
+    put() only copies the frame into one of up to queue_size buffers, so the capture loop never waits
+    for the encoder. Buffers are allocated the first time the queue is that deep and then reused, so a
+    recording whose encoder keeps up holds only a few frames. When every buffer is queued, drop_policy
+    decides what is lost:
+    "oldest" recycles the oldest queued frame, "newest" discards the incoming one.
+    Capture timestamps are written to a .csv next to the video and optionally drawn on each frame.
+    """
+
+    def __init__(self, path, fps, size, codec="mp4v", queue_size=30, drop_policy="oldest", overlay=True):
+        super().__init__(daemon=True)
+        self.logger = _logger
+
+        if drop_policy not in ("oldest", "newest"):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.path = path
+        self.fps = float(fps)
+        self.size = tuple(size)  # (width, height)
+        self.codec = codec
+        self.drop_policy = drop_policy
+        self.overlay = overlay
+
+        self.queue_size = queue_size
+        # buffers allocated so far, and those not holding a queued frame
+        self.allocated = 0
+        self.free = []
+        # (buffer, frame number, capture perf_counter, wall clock)
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.is_running = True
+
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+        self.latency = RunningStats()
+
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), self.fps, self.size)
+        if not self.writer.isOpened():
+            raise IOError(f"Can't open video writer: {path} ({codec})")
+        self.timestamps = open(os.path.splitext(path)[0] + ".csv", "w", encoding="utf-8")
+        self.timestamps.write("frame,capture_time,wall_time\n")
+
+    def put(self, frame, timestamp=None):
+        """Queue a copy of frame; never blocks. Returns False when a frame was dropped."""
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if frame.shape[1::-1] != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        with self.condition:
+            if not self.is_running:
+                return False
+            number = self.received
+            self.received += 1
+            if self.free:
+                buffer = self.free.pop()
+                ok = True
+            elif self.allocated < self.queue_size:
+                buffer = np.empty((self.size[1], self.size[0], 3), np.uint8)
+                self.allocated += 1
+                ok = True
+            elif self.drop_policy == "oldest":
+                buffer = self.queue.popleft()[0]
+                self.dropped += 1
+                ok = False
+            else:
+                self.dropped += 1
+                return False
+            np.copyto(buffer, frame)
+            self.queue.append((buffer, number, timestamp, datetime.datetime.now()))
+            self.condition.notify()
+            return ok
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and self.is_running:
+                    self.condition.wait()
+                if not self.queue:
+                    break
+                buffer, number, timestamp, wall = self.queue.popleft()
+            if self.overlay:
+                cv2.putText(buffer, wall.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3], (10, self.size[1] - 12),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2, cv2.LINE_AA)
+            self.writer.write(buffer)
+            self.timestamps.write(f"{number},{timestamp:.6f},{wall.isoformat()}\n")
+            self.latency.add(time.perf_counter() - timestamp)
+            with self.condition:
+                self.written += 1
+                self.free.append(buffer)
+        self.writer.release()
+        self.timestamps.close()
+
+    def stop(self, timeout=10.0):
+        """Encode what is queued, then close the file."""
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        self.join(timeout)
+        return self.stats()
+
+    def stats(self):
+        with self.condition:
+            return {"received": self.received, "written": self.written, "dropped": self.dropped,
+                    "queued": len(self.queue), "buffers": self.allocated,
+                    "latency_mean": self.latency.mean, "latency_max": self.latency.max}
+
+
+class ReplayBuffer(threading.Thread):
+    """
+    Keeps the last `seconds` of frames in memory as JPEG, capped at `budget` bytes.
+    Frames handed over by put() are copied into a small pool of preallocated buffers and encoded on this
+    thread; when the encoder falls behind, the incoming frame is skipped rather than delaying capture.
+    dump() writes the buffered frames to a video file on another background thread.
+    """
+
+    def __init__(self, seconds=30, budget=256 * 1024 * 1024, quality=80, pool_size=4):
+        super().__init__(daemon=True)
+        self.logger = _logger
+
+        self.seconds = seconds
+        self.budget = budget
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.pool_size = pool_size
+        self.free = []
+        self.shape = None
+
+        # frames waiting for the encoder: (buffer, capture perf_counter)
+        self.pending = deque()
+        # encoded frames: (capture perf_counter, jpeg bytes)
+        self.frames = deque()
+        self.bytes = 0
+        self.skipped = 0
+        self.condition = threading.Condition()
+        self.is_running = True
+
+    def put(self, frame, timestamp=None):
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        with self.condition:
+            if frame.shape != self.shape:
+                # (re)allocate for a new frame size; buffers still pending keep their own shape
+                self.shape = frame.shape
+                self.free = [np.empty(frame.shape, frame.dtype) for _ in range(self.pool_size)]
+            if not self.free:
+                self.skipped += 1
+                return False
+            buffer = self.free.pop()
+            np.copyto(buffer, frame)
+            self.pending.append((buffer, timestamp))
+            self.condition.notify()
+            return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and self.is_running:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                buffer, timestamp = self.pending.popleft()
+            result, jpeg = cv2.imencode('.jpg', buffer, self.params)
+            with self.condition:
+                if buffer.shape == self.shape:
+                    self.free.append(buffer)
+                if not result:
+                    continue
+                jpeg = jpeg.tobytes()
+                self.frames.append((timestamp, jpeg))
+                self.bytes += len(jpeg)
+                while self.frames and (self.bytes > self.budget or self.frames[0][0] < timestamp - self.seconds):
+                    self.bytes -= len(self.frames.popleft()[1])
+
+    def stop(self):
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        self.join(1.0)
+
+    def stats(self):
+        with self.condition:
+            duration = self.frames[-1][0] - self.frames[0][0] if self.frames else 0.0
+            return {"frames": len(self.frames), "bytes": self.bytes, "seconds": duration, "skipped": self.skipped}
+
+    def dump(self, path, codec="mp4v", callback=None):
+        """
+        Write the buffered frames to path in the background and return the thread.
+        callback(path, frame count) is called from that thread when the file is complete.
+        """
+        with self.condition:
+            frames = list(self.frames)
+        thread = threading.Thread(target=self._dump, args=(path, codec, frames, callback), daemon=True)
+        thread.start()
+        return thread
+
+    def _dump(self, path, codec, frames, callback):
+        if not frames:
+            self.logger.warning("Replay buffer is empty")
+            return
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 else 30.0
+        writer = None
+        written = 0
+        corrupt = 0
+        for _, jpeg in frames:
+            image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                corrupt += 1
+                continue
+            if writer is None:
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, (image.shape[1], image.shape[0]))
+            writer.write(image)
+            written += 1
+        if corrupt:
+            self.logger.warning(f"Replay: skipped {corrupt} frames that could not be decoded")
+        if writer is None:
+            self.logger.error(f"Replay not saved: no frame of {len(frames)} could be decoded")
+            return
+        writer.release()
+        self.logger.debug(f"Replay saved: {path} ({written} frames, {duration:.1f} s)")
+        if callback is not None:
+            callback(path, written)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import math
+import os
+import sys
+import time
+
+if os.name == 'nt' and sys.version_info < (3, 11):
+    # before 3.11 time.sleep() on Windows runs on the ~15.6 ms system tick; ask for 1 ms
+    try:
+        import ctypes
+        ctypes.windll.winmm.timeBeginPeriod(1)
+    except (ImportError, AttributeError, OSError):
+        pass
+
+# how late time.sleep() has woken up recently (a maximum that decays with every sleep);
+# sleep_until busy-waits at least this long, so a coarse OS timer can't make a deadline late
+_oversleep = 0.0
+OVERSLEEP_DECAY = 0.99
+# beyond this the sleep is too coarse to be worth compensating for by spinning
+MAX_SPIN = 0.02
+
+
+def sleep_until(deadline, spin=0.0005):
+    """
+    Sleep until the absolute perf_counter() deadline.
+    The OS sleep covers everything except the last `spin` seconds (or the measured oversleep of
+    time.sleep when that is longer), which are busy-waited so that wake-up is as precise as the
+    old busy_wait without burning a whole core.
+    Returns the measured lateness in seconds (>= 0).
+    """
+    global _oversleep
+    margin = min(max(spin, _oversleep), MAX_SPIN)
+    remaining = deadline - time.perf_counter()
+    if remaining > margin:
+        requested = remaining - margin
+        t = time.perf_counter()
+        time.sleep(requested)
+        over = time.perf_counter() - t - requested
+        _oversleep = max(over, _oversleep * OVERSLEEP_DECAY)
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            return now - deadline
+
+
+class RunningStats:
+    """
+    Running mean, standard deviation and maximum of a series of timings in seconds.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.max = 0.0
+        self.missed = 0
+
+    def add(self, error):
+        # Welford's online algorithm
+        self.count += 1
+        delta = error - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (error - self.mean)
+        if abs(error) > abs(self.max):
+            self.max = error
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / self.count) if self.count > 1 else 0.0
+
+    def summary(self):
+        return {"count": self.count, "mean": self.mean, "std": self.std, "max": self.max, "missed": self.missed}
+
+
+class FrameScheduler:
+    """
+    Paces a loop at a fixed rate against absolute deadlines.
+    Deadlines are advanced by exactly one period each tick, so the error of one frame
+    does not carry over into the next. When the loop falls more than one period behind,
+    the schedule is re-anchored to now instead of bursting to catch up.
+    """
+
+    def __init__(self, fps, spin=0.0005):
+        self.spin = spin
+        self.stats = RunningStats()
+        self.period = None
+        self.deadline = None
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        fps = float(fps)
+        if fps <= 0:
+            raise ValueError(f"fps must be positive: {fps}")
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.reset()
+
+    def reset(self):
+        self.deadline = None
+        self.stats.reset()
+
+    def wait(self):
+        """
+        Block until the next frame deadline and return the lateness in seconds.
+        """
+        now = time.perf_counter()
+        if self.deadline is None:
+            self.deadline = now + self.period
+        else:
+            self.deadline += self.period
+            if now > self.deadline + self.period:
+                # frame work overran the schedule; drop the missed slots
+                missed = int((now - self.deadline) // self.period) + 1
+                self.stats.missed += missed
+                self.deadline += missed * self.period
+        late = sleep_until(self.deadline, self.spin)
+        self.stats.add(late)
+        return late
@@ -2,16 +2,216 @@
 # -*- coding: utf-8 -*-
 import math
 import os
+import threading
 import time
+from collections import deque
 
 import serial
 from logging import getLogger, DEBUG, NullHandler, StreamHandler
 
+from Keys import binary2row, decode_binary, center
+from Latency import tracker
+from Scheduler import RunningStats
+from Trace import TraceWriter
+
+
+def wireTime(ser, data, written):
+    """
+    Estimated time the last bit of data leaves the port: write() returns once the driver has the bytes,
+    so add their transmit time (10 bits per byte with start and stop bit).
+    """
+    baudrate = getattr(ser, 'baudrate', None)
+    return written + len(data) * 10 / baudrate if baudrate else written
+
+
+class SerialWriter(threading.Thread):
+    """
+    Writes queued rows to the serial port on its own thread so a slow or blocked port
+    does not stall the caller (usually the Qt GUI thread); put() never waits.
+    A queued controller state that is superseded before it is flushed is replaced by the newer one,
+    but only when both carry the same buttons, hat and sticks fields and the same sticks are tilted,
+    so press/release edges are always sent in order. When the queue is full (a stalled port) the oldest
+    row is dropped and counted; stick values only that row carried are merged into the next one.
+    Everything queued when the thread wakes up is sent in one write() (up to max_batch bytes), so
+    rows that pile up behind a slow write cost one system call instead of one each.
+    A row may carry a Latency.Cause; its wire latency is recorded once the row has been written.
+    """
+
+    def __init__(self, ser, logger, maxsize=64, max_batch=4096):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.logger = logger
+        self.maxsize = maxsize
+        self.max_batch = max_batch
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.is_running = True
+
+        self.written = 0
+        self.writes = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.latency = RunningStats()
+
+    @staticmethod
+    def asciiSticks(parts):
+        """Return the (x, y) fields of the left and right stick carried by a split ASCII row (None if absent)."""
+        flags = int(parts[0], 16)
+        values = parts[2:]
+        left = right = None
+        if flags & 0x2:
+            left, values = tuple(values[0:2]), values[2:]
+        if flags & 0x1:
+            right = tuple(values[0:2])
+        return left, right
+
+    @staticmethod
+    def stateKey(row):
+        """
+        Return the part of a controller state row that a newer row must share to supersede it,
+        or None when the row must not be replaced.
+        Besides buttons and hat, the key holds whether each carried stick is tilted, so a row that
+        moves a stick to or from the centre is never replaced: a short stick tap stays on the wire.
+        """
+        if isinstance(row, (bytes, bytearray)):
+            try:
+                fields = decode_binary(row)
+            except ValueError:
+                return None
+            if fields['flags']:
+                return None
+            # a binary frame always carries both sticks
+            return (fields['btn'], fields['hat'],
+                    (fields['lx'], fields['ly']) != (center, center), (fields['rx'], fields['ry']) != (center, center))
+        parts = row.split(' ')
+        if len(parts) not in (2, 4, 6):
+            return None
+        # an ASCII row only carries the sticks that changed, flagged in the low bits of its first field,
+        # so rows with the same first field and hat set the same fields and the newer one supersedes
+        centre = (format(center, 'x'), format(center, 'x'))
+        left, right = SerialWriter.asciiSticks(parts)
+        return (parts[0], parts[1],
+                None if left is None else left != centre, None if right is None else right != centre)
+
+    @staticmethod
+    def mergeSticks(dropped, data):
+        """
+        Return the ASCII row data extended with the sticks that only the dropped row carried, or None when
+        there is nothing to add. Binary frames always carry both sticks and need no merge.
+        """
+        try:
+            dropped_parts = dropped.decode('ascii').split()
+            parts = data.decode('ascii').split()
+        except UnicodeDecodeError:
+            return None
+        if len(dropped_parts) not in (4, 6) or len(parts) not in (2, 4, 6):
+            return None
+        dropped_left, dropped_right = SerialWriter.asciiSticks(dropped_parts)
+        left, right = SerialWriter.asciiSticks(parts)
+        if (left is not None or dropped_left is None) and (right is not None or dropped_right is None):
+            return None
+        left = left or dropped_left
+        right = right or dropped_right
+        send_btn = int(parts[0], 16) & ~0x3
+        fields = [parts[1]]
+        if left is not None:
+            send_btn |= 0x2
+            fields += left
+        if right is not None:
+            send_btn |= 0x1
+            fields += right
+        return ' '.join([format(send_btn, '#06x')] + fields)
+
+    def put(self, data, key=None, cause=None):
+        with self.condition:
+            if key is not None and self.queue and self.queue[-1][1] == key:
+                # the replaced row may have been the reaction to a frame
+                self.queue[-1] = (data, key, cause or self.queue[-1][2])
+                self.coalesced += 1
+                return
+            if len(self.queue) >= self.maxsize:
+                if not self.dropped:
+                    self.logger.warning("Serial port is not keeping up, dropping the oldest queued rows")
+                dropped = self.queue.popleft()[0]
+                self.dropped += 1
+                # the stick values of a partial row may be repeated by no later row; keep them
+                following = self.queue[0] if self.queue else (data, key, cause)
+                row = self.mergeSticks(dropped, following[0])
+                if row is not None:
+                    following = ((row + '\r\n').encode('utf-8'), self.stateKey(row), following[2])
+                    if self.queue:
+                        self.queue[0] = following
+                    else:
+                        data, key, cause = following
+            self.queue.append((data, key, cause))
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and self.is_running:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                batch = bytearray()
+                # (end offset in batch, cause) of the rows that are the reaction to a frame
+                causes = []
+                rows = 0
+                while self.queue and (not batch or len(batch) + len(self.queue[0][0]) <= self.max_batch):
+                    data, _, cause = self.queue.popleft()
+                    batch += data
+                    rows += 1
+                    if cause is not None:
+                        causes.append((len(batch), cause))
+            t = time.perf_counter()
+            try:
+                self.ser.write(batch)
+            except serial.SerialTimeoutException as e:
+                self.logger.error(f"Write timeout : {e}")
+                causes = []
+            except serial.serialutil.SerialException as e:
+                self.logger.error(f"Error : {e}")
+                causes = []
+            written = time.perf_counter()
+            self.latency.add(written - t)
+            for end, cause in causes:
+                tracker.recordWire(cause, wireTime(self.ser, memoryview(batch)[:end], written))
+            self.written += rows
+            self.writes += 1
+
+    def stop(self, timeout=1.0):
+        """Flush what is queued and stop the thread."""
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        self.join(timeout)
+
+    def stats(self):
+        with self.condition:
+            depth = len(self.queue)
+        return {"depth": depth, "max_depth": self.max_depth, "written": self.written, "writes": self.writes,
+                "coalesced": self.coalesced, "dropped": self.dropped,
+                "latency_mean": self.latency.mean, "latency_max": self.latency.max}
+
 
 class Sender:
-    def __init__(self, is_show_serial, if_print=True):
+    def __init__(self, is_show_serial, if_print=True, is_binary=False,
+                 baudrate=9600, port=None, write_timeout=None, is_async=True):
         self.ser = None
+        self.writer = None
+        # write from a SerialWriter thread instead of the calling thread
+        self.is_async = is_async
         self.is_show_serial = is_show_serial
+        # send fixed-size binary frames (Keys.BINARY_FRAME) instead of ASCII rows
+        self.is_binary = is_binary
+        self.baudrate = baudrate
+        # explicit device path (e.g. /dev/serial/by-id/...), overrides the port number
+        self.port = port
+        self.write_timeout = write_timeout
+        # Trace.TraceWriter recording every row, see startTrace()
+        self.trace = None
 
         self.logger = getLogger(__name__)
         self.logger.addHandler(StreamHandler())
@@ -39,42 +239,93 @@ class Sender:
                     "LEFT", "TOP_LEFT",
                     "CENTER"]
 
+    def portName(self, portNum):
+        if self.port:
+            return self.port
+        portNum = str(portNum)
+        if not portNum.isdigit():
+            # already a device name or path
+            return portNum
+        if os.name == 'nt':
+            return f"COM{portNum}"
+        elif os.name == 'posix':
+            for prefix in ("/dev/ttyUSB", "/dev/ttyACM"):
+                if os.path.exists(prefix + portNum):
+                    return prefix + portNum
+            return "/dev/ttyUSB" + portNum
+        return None
+
     def openSerial(self, portNum):
+        name = self.portName(portNum)
+        if name is None:
+            self.logger.warning('Not supported OS.')
+            return False
         try:
-            if os.name == 'nt':
-                self.logger.debug(f"Connecting to COM{portNum}.")
-                self.ser = serial.Serial(f"COM{portNum}", 9600)
-                return True
-            elif os.name == 'posix':
-                self.logger.debug('connecting to ' + "/dev/ttyUSB" + str(portNum))
-                self.ser = serial.Serial("/dev/ttyUSB" + str(portNum), 9600)
-                return True
-            else:
-                self.logger.warning('Not supported OS.')
-                return False
-        except IOError as e:
+            self.logger.debug(f"Connecting to {name} at {self.baudrate} baud.")
+            self.ser = serial.Serial(name, self.baudrate, write_timeout=self.write_timeout)
+            if self.is_async:
+                self.writer = SerialWriter(self.ser, self.logger)
+                self.writer.start()
+            return True
+        except (IOError, ValueError) as e:
             self.logger.error("COM Port: can't be established.")
             # self.logger.debug(e)
             return False
 
     def closeSerial(self):
         self.logger.debug("Close the serial communication.")
+        if self.writer is not None:
+            self.writer.stop()
+            self.logger.debug(f"Serial writer: {self.writer.stats()}")
+            self.writer = None
         self.ser.close()
 
+    def startTrace(self, path):
+        """Record every row sent from now on to a binary trace file (see Trace.py)."""
+        self.stopTrace()
+        self.trace = TraceWriter(path)
+        self.logger.debug(f"Tracing inputs to {path}")
+
+    def stopTrace(self):
+        trace, self.trace = self.trace, None
+        if trace is not None:
+            trace.close()
+            self.logger.debug(f"Input trace saved: {trace.path} ({trace.count} records)")
+
     def isOpened(self):
         self.logger.debug("Check if serial communication is open.")
         return not self.ser is None and self.ser.isOpen()
 
-    def writeRow(self, row, is_show=False) -> time:
+    def writeRow(self, row, is_show=False, cause=None) -> time:
+        """
+        Send one row (str) or binary frame (bytes).
+        cause (Latency.Cause) marks the row as the reaction to a camera frame, for the latency histograms.
+        """
         try:
             self.time_bef = time.perf_counter()
-            if self.before is not None and self.before != 'end' and is_show:
-                output = self.before.split(' ')
-                self.show_input(output)
+            trace = self.trace
+            if trace is not None:
+                trace.writeRow(row, self.time_bef)
+            if self.before is not None and is_show:
+                before = self.toRow(self.before)
+                if before != 'end':
+                    output = before.split(' ')
+                    self.show_input(output)
 
-            self.ser.write((row + '\r\n').encode('utf-8'))
+            if isinstance(row, (bytes, bytearray)):
+                data = row
+            else:
+                data = (row + '\r\n').encode('utf-8')
+            if self.writer is not None:
+                self.writer.put(data, SerialWriter.stateKey(row), cause)
+            else:
+                self.ser.write(data)
+                if cause is not None:
+                    tracker.recordWire(cause, wireTime(self.ser, data, time.perf_counter()))
             self.time_aft = time.perf_counter()
             self.before = row
+        except serial.SerialTimeoutException as e:
+            self.logger.error(f"Write timeout : {e}")
         except serial.serialutil.SerialException as e:
             # self.logger.debug(e)
             self.logger.error(f"Error : {e}")
@@ -84,10 +335,16 @@ class Sender:
         # self.logger.debug(f"{row}")
         # Show sending serial datas
         if self.is_show_serial:
-            self.logger.debug(row)
+            self.logger.debug(self.toRow(row))
         #return time.perf_counter()
         return
 
+    def toRow(self, row):
+        # binary frames are shown in the ASCII row layout
+        if isinstance(row, (bytes, bytearray)):
+            return binary2row(row)
+        return row
+
     def show_input(self, output):
         # self.logger.debug(output)
         btns = [self.Buttons[x] for x in range(0, 16) if int(output[0], 16) >> x & 1]
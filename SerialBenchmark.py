@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Serial speed probe and latency benchmark.
+
+    python SerialBenchmark.py --port /dev/ttyACM0
+    python SerialBenchmark.py --loopback          # pty stand-in, no hardware needed (posix only)
+
+For every baud rate the port accepts, this reports bytes/sec and per-report write latency
+(write + flush until the driver has drained the bytes) for ASCII rows and binary frames.
+--batch N also measures writing N reports per write(), as SerialWriter does with rows that queue up.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+
+import serial
+from logging import getLogger, DEBUG, StreamHandler
+
+from Keys import SendFormat, Button, Hat
+
+logger = getLogger(__name__)
+logger.addHandler(StreamHandler())
+logger.setLevel(DEBUG)
+
+SUPPORTED_BAUDRATES = (9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600)
+
+
+class Loopback:
+    """
+    pty-backed stand-in for the microcontroller. The slave end is opened with pyserial like a
+    real port, and the master end is drained by a thread that counts the received bytes.
+    The slave fd stays open until close(): reading the master of a pty with no open slave
+    fails with EIO, which would end the drain before pyserial opens the port.
+    """
+
+    def __init__(self):
+        import pty
+        import tty
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+        self.received = 0
+        self.is_running = True
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        while self.is_running:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            self.received += len(data)
+
+    def close(self):
+        # closing the last slave fd ends the drain's read with EIO; the master is closed only
+        # after the thread is gone, so it can't read from a pty that reuses the fd number
+        self.is_running = False
+        os.close(self.slave)
+        self.thread.join(1)
+        os.close(self.master)
+
+
+def probe_baudrates(ser, rates=SUPPORTED_BAUDRATES):
+    """
+    Return the baud rates the driver accepts for the open port.
+    The last accepted rate is left configured on the port.
+    """
+    accepted = []
+    for rate in rates:
+        try:
+            ser.baudrate = rate
+        except (ValueError, serial.SerialException, OSError) as e:
+            logger.debug(f"{rate} baud rejected: {e}")
+            continue
+        accepted.append(rate)
+    return accepted
+
+
+def sample_reports(reports, binary):
+    fmt = SendFormat()
+    rows = []
+    for i in range(reports):
+        if i % 2 == 0:
+            fmt.setButton([Button.A])
+            fmt.setHat([Hat.TOP])
+        else:
+            fmt.unsetButton([Button.A])
+            fmt.unsetHat()
+        fmt.L_stick_changed = fmt.R_stick_changed = True
+        if binary:
+            rows.append(fmt.convert2bytes())
+        else:
+            rows.append((fmt.convert2str() + '\r\n').encode('utf-8'))
+    return rows
+
+
+def benchmark(ser, rate, reports=200, binary=False, batch=1):
+    """
+    Write `reports` controller reports at `rate` baud, `batch` reports per write(), and measure
+    per-report latency. Returns None when no report could be measured.
+    """
+    ser.baudrate = rate
+    rows = sample_reports(reports, binary)
+    latencies = []
+    total = 0
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        data = b''.join(rows[i:i + batch])
+        count = len(rows[i:i + batch])
+        t = time.perf_counter()
+        ser.write(data)
+        ser.flush()
+        latency = (time.perf_counter() - t) / count
+        latencies.extend([latency] * count)
+        total += len(data)
+    elapsed = time.perf_counter() - start
+    if not latencies:
+        return None
+    return {
+        "baudrate": rate,
+        "format": "binary" if binary else "ascii",
+        "batch": batch,
+        "bytes_per_report": total / reports,
+        "bytes_per_sec": total / elapsed,
+        "latency_mean": statistics.mean(latencies),
+        "latency_p99": sorted(latencies)[int(len(latencies) * 0.99) - 1],
+        "latency_theoretical": total / reports * 10 / rate,  # 8N1: 10 bits per byte
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial speed probe and latency benchmark")
+    parser.add_argument("--port", help="serial device (COM3, /dev/ttyACM0, /dev/serial/by-id/...)")
+    parser.add_argument("--loopback", action="store_true", help="use a pty stand-in instead of hardware")
+    parser.add_argument("--reports", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=1, help="also measure N reports per write")
+    parser.add_argument("--rates", type=int, nargs="*", default=list(SUPPORTED_BAUDRATES))
+    args = parser.parse_args()
+
+    loopback = None
+    if args.loopback:
+        loopback = Loopback()
+        port = loopback.name
+    elif args.port:
+        port = args.port
+    else:
+        parser.error("either --port or --loopback is required")
+
+    ser = serial.Serial(port, args.rates[0], write_timeout=5)
+    try:
+        rates = probe_baudrates(ser, args.rates)
+        logger.info(f"{port}: accepted baud rates {rates}")
+        batches = sorted({1, max(1, args.batch)})
+        for rate in rates:
+            for binary in (False, True):
+                for batch in batches:
+                    r = benchmark(ser, rate, args.reports, binary, batch)
+                    label = f"{rate:>7} {'binary' if binary else 'ascii':>6} x{batch}"
+                    if r is None:
+                        logger.info(f"{label}: no echo, nothing measured")
+                        continue
+                    logger.info(f"{label}: {r['bytes_per_report']:.1f} B/report, "
+                                f"{r['bytes_per_sec']:.0f} B/s, latency mean {r['latency_mean'] * 1000:.2f} ms "
+                                f"p99 {r['latency_p99'] * 1000:.2f} ms "
+                                f"(wire {r['latency_theoretical'] * 1000:.2f} ms)")
+    finally:
+        ser.close()
+        if loopback is not None:
+            loopback.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Binary trace of every controller state sent over serial.
+
+A trace file is a 32-byte header followed by fixed 16-byte records:
+
+    header: magic b"VCTRACE\\0", version (u16), record size (u16), record count (u32),
+            wall clock at start (f64, epoch seconds), perf_counter at start (f64)
+    record: perf_counter (f64), buttons (u16, Button bits), hat (u8), flags (u8, 0x1 = end),
+            lx, ly, rx, ry (u8)
+
+`python Trace.py <file>` renders a trace as press()/hold()/wait() calls for a PythonCommand.
+"""
+import argparse
+import datetime
+import math
+import mmap
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from Keys import Button, Hat, Stick, Direction, BINARY_FRAME, BINARY_FLAG_END, center
+
+TRACE_MAGIC = b"VCTRACE\0"
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('<8sHHIdd')
+TRACE_RECORD = struct.Struct('<dHBBBBBB')
+
+TraceRecord = namedtuple('TraceRecord', ['time', 'btn', 'hat', 'flags', 'lx', 'ly', 'rx', 'ry'])
+
+
+class TraceWriter:
+    """
+    Appends records to a memory-mapped file.
+    The file grows by `chunk` records at a time, so a write is a struct.pack_into into the mapping
+    without a system call; the record count in the header is updated by flush() and close(), and
+    close() trims the unused tail.
+    """
+
+    def __init__(self, path, chunk=65536):
+        self.path = path
+        self.chunk = chunk
+        self.count = 0
+        self.lock = threading.Lock()
+        # the sticks an ASCII row did not carry keep their previous value
+        self.sticks = [center, center, center, center]
+        self.start = time.perf_counter()
+
+        self.file = open(path, "w+b")
+        self.capacity = 0
+        self.map = None
+        self.grow()
+        TRACE_HEADER.pack_into(self.map, 0, TRACE_MAGIC, TRACE_VERSION, TRACE_RECORD.size, 0,
+                               time.time(), self.start)
+
+    def grow(self):
+        self.capacity += self.chunk
+        size = TRACE_HEADER.size + self.capacity * TRACE_RECORD.size
+        if self.map is not None:
+            self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def write(self, btn, hat, lx, ly, rx, ry, flags=0, timestamp=None):
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        with self.lock:
+            if self.map is None:
+                return
+            if self.count == self.capacity:
+                self.grow()
+            TRACE_RECORD.pack_into(self.map, TRACE_HEADER.size + self.count * TRACE_RECORD.size,
+                                   timestamp, btn, int(hat), flags, lx, ly, rx, ry)
+            self.count += 1
+
+    def writeRow(self, row, timestamp=None):
+        """Record a row as passed to Sender.writeRow (ASCII row, 'end' or binary frame)."""
+        if isinstance(row, (bytes, bytearray)):
+            _, send_btn, hat_flags, lx, ly, rx, ry, _ = BINARY_FRAME.unpack(row)
+            self.sticks = [lx, ly, rx, ry]
+            self.write(send_btn >> 2, hat_flags & 0xF, lx, ly, rx, ry, hat_flags >> 4, timestamp)
+            return
+        if row == 'end':
+            self.write(0, Hat.CENTER, center, center, center, center, BINARY_FLAG_END, timestamp)
+            return
+        parts = row.split(' ')
+        send_btn = int(parts[0], 16)
+        values = [int(v, 16) for v in parts[2:]]
+        if send_btn & 0x2:
+            self.sticks[0:2] = values[0:2]
+            values = values[2:]
+        if send_btn & 0x1:
+            self.sticks[2:4] = values[0:2]
+        self.write(send_btn >> 2, int(parts[1]), *self.sticks, 0, timestamp)
+
+    def flush(self):
+        with self.lock:
+            if self.map is None:
+                return
+            struct.pack_into('<I', self.map, 12, self.count)
+            self.map.flush()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.map is None:
+                return
+            self.map.close()
+            self.map = None
+            self.file.truncate(TRACE_HEADER.size + self.count * TRACE_RECORD.size)
+            self.file.close()
+
+
+def readTrace(path):
+    """
+    Return (header dict, [TraceRecord]) with record times in seconds since the start of the trace.
+    A file that was not closed (count 0 in the header) is read up to its first empty record.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, record_size, count, wall, start = TRACE_HEADER.unpack_from(data, 0)
+    if magic != TRACE_MAGIC:
+        raise ValueError(f"Not a trace file: {path}")
+    if version != TRACE_VERSION or record_size != TRACE_RECORD.size:
+        raise ValueError(f"Unsupported trace version {version} (record size {record_size})")
+    available = (len(data) - TRACE_HEADER.size) // record_size
+    records = []
+    for i in range(count or available):
+        fields = TRACE_RECORD.unpack_from(data, TRACE_HEADER.size + i * record_size)
+        if not count and fields[0] == 0.0:
+            break
+        records.append(TraceRecord(fields[0] - start, *fields[1:]))
+    header = {"version": version, "count": len(records), "started": datetime.datetime.fromtimestamp(wall)}
+    return header, records
+
+
+def directionName(stick, x, y):
+    for name, value in vars(Direction).items():
+        if isinstance(value, Direction) and value.stick == stick and (value.x, value.y) == (x, y):
+            return f"Direction.{name}"
+    dx, dy = x - 127.5, y - 127.5
+    angle = round(math.degrees(math.atan2(dy, dx)), 1)
+    mag = round(min(1.0, math.hypot(dx, dy) / 127.5), 2)
+    return f"Direction({stick}, {angle}, {mag})"
+
+
+def inputsOf(record):
+    """Return the inputs held in a record as source strings (Button.A, Hat.TOP, Direction.UP, ...)."""
+    inputs = [f"Button.{b.name}" for b in Button if record.btn & b]
+    if record.hat != Hat.CENTER:
+        inputs.append(f"Hat.{Hat(record.hat).name}")
+    # stored y is inverted (see SendFormat.setAnyDirection)
+    if (record.lx, record.ly) != (center, center):
+        inputs.append(directionName(Stick.LEFT, record.lx, 255 - record.ly))
+    if (record.rx, record.ry) != (center, center):
+        inputs.append(directionName(Stick.RIGHT, record.rx, 255 - record.ry))
+    return inputs
+
+
+def renderPress(records, min_wait=0.0005):
+    """
+    Render the state changes of a trace as Macro calls (one source line each).
+    A state that starts and ends at neutral becomes press(); anything else becomes hold()/holdEnd().
+    """
+    states = []
+    for record in records:
+        if record.flags & BINARY_FLAG_END:
+            break
+        inputs = inputsOf(record)
+        if states and states[-1][1] == inputs:
+            continue
+        states.append((record.time, inputs))
+    if not states:
+        return []
+
+    def seconds(t):
+        return f"{max(t, 0.0):.3f}"
+
+    def joined(inputs):
+        return f"[{', '.join(inputs)}]"
+
+    lines = []
+    i = 0
+    while i < len(states):
+        t, inputs = states[i]
+        previous = states[i - 1][1] if i > 0 else []
+        next_t = states[i + 1][0] if i + 1 < len(states) else t
+        if not inputs:
+            if previous:
+                lines.append(f"self.holdEnd({joined(previous)})")
+            if next_t - t >= min_wait:
+                lines.append(f"self.wait({seconds(next_t - t)})")
+            i += 1
+            continue
+        if not previous and i + 1 < len(states) and not states[i + 1][1]:
+            # neutral -> inputs -> neutral is a tap
+            wait_t = states[i + 2][0] if i + 2 < len(states) else next_t
+            lines.append(f"self.press({joined(inputs)}, duration={seconds(next_t - t)}, "
+                         f"wait={seconds(wait_t - next_t)})")
+            i += 2
+            continue
+        released = [x for x in previous if x not in inputs]
+        pressed = [x for x in inputs if x not in previous]
+        if released:
+            lines.append(f"self.holdEnd({joined(released)})")
+        if pressed:
+            lines.append(f"self.hold({joined(pressed)}, wait={seconds(next_t - t)})")
+        elif next_t - t >= min_wait:
+            lines.append(f"self.wait({seconds(next_t - t)})")
+        i += 1
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show an input trace recorded by Sender.startTrace")
+    parser.add_argument("trace")
+    parser.add_argument("--raw", action="store_true", help="print every record instead of press() calls")
+    args = parser.parse_args()
+
+    header, records = readTrace(args.trace)
+    print(f"# {args.trace}: {header['count']} records, started {header['started']:%Y-%m-%d %H:%M:%S}")
+    if args.raw:
+        for r in records:
+            print(f"{r.time:10.4f} {r.btn:#06x} {r.hat} {r.flags} {r.lx:3d} {r.ly:3d} {r.rx:3d} {r.ry:3d}")
+    else:
+        for line in renderPress(records):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
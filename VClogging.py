@@ -6,7 +6,8 @@ from PyQt5.Qt import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
-from queue import Queue
+import threading
+from collections import deque
 
 now = dt.datetime.now()
 time = now.strftime('%Y%m%d-%H%M%S')
@@ -23,6 +24,46 @@ mapping = {
 }
 
 
+class LogQueue(object):
+    """
+    Bounded buffer of the text written to stdout / stderr, filled from any thread.
+    put() never blocks: once maxsize writes are pending, the oldest one is dropped and counted,
+    so the lines that end a burst (usually the error that explains it) are the ones kept.
+    """
+
+    def __init__(self, maxsize=20000):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.chunks = deque(maxlen=maxsize)
+        self.written = 0
+        self.dropped = 0
+        # dropped since the last drain()
+        self.pending_dropped = 0
+
+    def put(self, text):
+        with self.lock:
+            if len(self.chunks) == self.maxsize:
+                self.dropped += 1
+                self.pending_dropped += 1
+            self.chunks.append(text)
+            self.written += 1
+
+    def drain(self):
+        """
+        Return everything written since the last drain() as one string,
+        starting with a single marker line when older writes had to be dropped.
+        """
+        with self.lock:
+            chunks = self.chunks
+            dropped = self.pending_dropped
+            self.chunks = deque(maxlen=self.maxsize)
+            self.pending_dropped = 0
+        text = "".join(chunks)
+        if dropped:
+            text = f"[log] {dropped} lines dropped\n" + text
+        return text
+
+
 class WriteStream(object):
     def __init__(self, queue):
         self.queue = queue
@@ -35,18 +76,37 @@ class WriteStream(object):
 
 
 class MyReceiver(QObject):
+    """
+    Delivers the LogQueue to the GUI in batches: a timer on the GUI thread drains the queue every
+    `interval` ms and emits the joined text once, so a flood of log lines costs one append per tick.
+    """
     mysignal = pyqtSignal(str)
 
-    def __init__(self, queue, *args, **kwargs):
+    def __init__(self, queue, interval=50, *args, **kwargs):
         QObject.__init__(self, *args, **kwargs)
         self.queue = queue
+        self.batches = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.drain)
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.drain()
 
     @pyqtSlot()
-    def run(self):
-        while True:
-            text = self.queue.get()
+    def drain(self):
+        text = self.queue.drain()
+        if text:
+            self.batches += 1
             self.mysignal.emit(text)
 
+    def counters(self):
+        return {"written": self.queue.written, "dropped": self.queue.dropped, "batches": self.batches}
+
 class ColorfulHandler(logging.StreamHandler):
     def emit(self, record: logging.LogRecord) -> None:
         record.levelname = mapping[record.levelname]
@@ -12,15 +12,19 @@ import sys
 import cv2
 import numpy as np
 import time
-from queue import Queue
+import datetime
 from logging import StreamHandler, getLogger, DEBUG, NullHandler
 import json
 
 import VClogging
-from VClogging import WriteStream, MyReceiver
-from Camera import VideoThread
+from VClogging import LogQueue, WriteStream, MyReceiver
+from Camera import CaptureManager
 import Sender
 from Keys import KeyPress, Button, Direction, Hat
+from Command import CommandLoader, CommandWorker
+from InputReplay import InputRecorder, InputReplay
+from Recognition import TemplateMatcher, BatchMatcher
+from Latency import CAPTURE_DISPLAY, tracker as latency
 
 CURRENT_PATH = os.path.dirname(os.path.abspath(sys.argv[0]))
 
@@ -41,7 +45,19 @@ class Settings():
         if not isExistSetting:
             self.logger.debug("No configuration file exists.")
             with open(self.SettingFileName, "w") as f:
-                init_setting = {'Camera': {'id': 0, 'fps': 30}, 'COM': 1}
+                init_setting = {'Camera': {'id': 0, 'fps': 30, 'extra': [], 'backend': "auto", 'fourcc': "",
+                                           'width': 1280, 'height': 720, 'capture_fps': 0, 'source': "",
+                                           'source_options': {'realtime': True, 'speed': 1.0, 'loop': False},
+                                           'probe_modes': []},
+                                'COM': 1,
+                                'Serial': {'binary': False, 'baudrate': 9600, 'port': "", 'write_timeout': 0.5},
+                                'Record': {'codec': "mp4v", 'container': "mp4", 'queue': 30, 'drop': "oldest",
+                                           'timestamp': True},
+                                'Replay': {'enabled': False, 'seconds': 30, 'budget_mb': 256, 'quality': 80},
+                                'Capture': {'format': "png", 'png_level': 3, 'jpeg_quality': 95,
+                                            'webp_quality': 95, 'roi': {}},
+                                'Trace': {'enabled': False, 'dir': "Traces"},
+                                'InputReplay': {'speed': 1.0, 'loop': False}}
                 json.dump(init_setting, f, ensure_ascii=False, indent=4, sort_keys=True, separators=(',', ': '))
             self.logger.debug("Generated the configuration file.")
 
@@ -87,15 +103,13 @@ class MainUI(QMainWindow):
         self.ui.setupUi(self)
         qApp.installEventFilter(self)
         # print関数のredirect処理
-        self.queue = Queue()
+        self.queue = LogQueue()
         sys.stdout = WriteStream(self.queue)
         sys.stderr = WriteStream(self.queue)
-        self.thread_txt = QThread()
-        self.my_receiver = MyReceiver(self.queue)
+        # appended in batches on a timer, so heavy logging can't starve the camera preview or key handling
+        self.my_receiver = MyReceiver(self.queue, 50, self)
         self.my_receiver.mysignal.connect(self.append_text)
-        self.my_receiver.moveToThread(self.thread_txt)
-        self.thread_txt.started.connect(self.my_receiver.run)
-        self.thread_txt.start()
+        self.my_receiver.start()
 
         self.logger = getLogger(__name__)
         self.logger.addHandler(StreamHandler(sys.stdout))
@@ -161,6 +175,7 @@ class MainUI(QMainWindow):
         self.ui.pushButton_OpenCaptureFolder.clicked.connect(self.OpenCaptureDir)
         self.ui.pushButton_reload.clicked.connect(self.CommandReload)
         self.ui.pushButton_start.clicked.connect(self.CommandStart)
+        self.ui.pushButton_pause.clicked.connect(self.CommandPause)
         self.ui.checkBox_GUIC.toggled.connect(self.GUIController)
         self.ui.pushButton_clear.clicked.connect(self.ClearLog)
         self.ui.actionQuit.triggered.connect(self.close)
@@ -182,16 +197,73 @@ class MainUI(QMainWindow):
         self.ui.fpsTxt.setValidator(validator)
 
 
-        # create the video capture thread
-        self.camera = VideoThread(self.Settings.settings["Camera"]["fps"],self.Settings.settings["Camera"]["id"])
+        # create the video capture threads; self.camera is the one shown in the preview
+        self.captureManager = CaptureManager()
+        camera_settings = self.Settings.settings["Camera"]
+        # "source" replaces the device with a video file, image directory or "synthetic"
+        self.camera = self.captureManager.add(camera_settings.get("source") or camera_settings["id"],
+                                              camera_settings["fps"],
+                                              (camera_settings.get("width", 1280), camera_settings.get("height", 720)),
+                                              camera_settings.get("backend", "auto"),
+                                              camera_settings.get("fourcc") or None,
+                                              camera_settings.get("capture_fps") or None,
+                                              camera_settings.get("source_options"),
+                                              camera_settings.get("probe_modes"),
+                                              preview=True)
         # connect its signal to the update_image slot
         self.camera.change_pixmap_signal.connect(self.update_image)
-        # start the thread
-        self.camera.reload_camera(self.Settings.settings["Camera"]["id"])
-        self.camera.start()
-
-        self.ser = Sender.Sender(self.ui.showSerial.isChecked())
+        self.camera.frame_stats_signal.connect(self.update_frame_stats)
+        self.camera.preview.setTarget(self.disply_width, self.display_height)
+        # additional cameras only publish on the frame bus (e.g. for commands)
+        for extra in self.Settings.settings["Camera"].get("extra", []):
+            self.captureManager.add(extra["id"], extra.get("fps", 30),
+                                    (extra.get("width", 1280), extra.get("height", 720)),
+                                    extra.get("backend", "auto"), extra.get("fourcc") or None,
+                                    extra.get("capture_fps") or None, extra.get("source_options"),
+                                    extra.get("probe_modes"))
+        capture = self.Settings.settings.get("Capture", {})
+        try:
+            self.camera.captureWriter.setFormat(capture.get("format", "png"), capture.get("png_level", 3),
+                                                capture.get("jpeg_quality", 95), capture.get("webp_quality", 95))
+        except ValueError as e:
+            self.logger.error(e)
+        self.camera.roi_presets = dict(capture.get("roi", {}))
+        replay = self.Settings.settings.get("Replay", {})
+        if replay.get("enabled", False):
+            self.camera.enableReplay(replay.get("seconds", 30), replay.get("budget_mb", 256),
+                                     replay.get("quality", 80))
+        self.actionSaveReplay = QAction("Save Replay", self)
+        self.actionSaveReplay.triggered.connect(self.SaveReplay)
+        self.ui.menu_Files.insertAction(self.ui.actionQuit, self.actionSaveReplay)
+        self.actionTrace = QAction("Trace Inputs", self)
+        self.actionTrace.setCheckable(True)
+        self.actionTrace.toggled.connect(self.ToggleTrace)
+        self.ui.menu_Files.insertAction(self.ui.actionQuit, self.actionTrace)
+        self.inputRecorder = None
+        self.actionRecordInputs = QAction("Record Inputs", self)
+        self.actionRecordInputs.setCheckable(True)
+        self.actionRecordInputs.toggled.connect(self.ToggleRecordInputs)
+        self.ui.menu_Files.insertAction(self.ui.actionQuit, self.actionRecordInputs)
+        self.actionReplayInputs = QAction("Replay Inputs...", self)
+        self.actionReplayInputs.triggered.connect(self.ReplayInputs)
+        self.ui.menu_Files.insertAction(self.ui.actionQuit, self.actionReplayInputs)
+
+        serial_settings = self.Settings.settings.get("Serial", {})
+        self.commandLoader = CommandLoader(os.path.join(CURRENT_PATH, "Commands"))
+        self.commandWorker = None
+        self.matcher = TemplateMatcher(os.path.join(CURRENT_PATH, "Template"))
+        self.batchMatcher = BatchMatcher(self.matcher)
+        self.CommandReload()
+
+        self.keyPress = None
+        self.ser = Sender.Sender(self.ui.showSerial.isChecked(),
+                                 is_binary=serial_settings.get("binary", False),
+                                 baudrate=serial_settings.get("baudrate", 9600),
+                                 port=serial_settings.get("port") or None,
+                                 write_timeout=serial_settings.get("write_timeout"))
         self.activateSerial()
+        if self.Settings.settings.get("Trace", {}).get("enabled", False):
+            self.actionTrace.setChecked(True)
 
 
         
@@ -202,7 +274,7 @@ class MainUI(QMainWindow):
     def SetFps(self):
         if int(self.ui.fpsTxt.text()) > 0:
             self.logger.debug(f"Set FPS to {self.ui.fpsTxt.text()}")
-            self.camera.fps = self.ui.fpsTxt.text()
+            self.camera.set_fps(self.ui.fpsTxt.text())
             self.camera.resume()
         else:
             self.logger.debug(f"Stop real-time camera updates.")
@@ -389,10 +461,10 @@ class MainUI(QMainWindow):
 
     def PressCameraReload(self):
         s = str(self.ui.CameraspinBox.text())
-        self.camera.CameraID = int(s)
-        self.camera.exit()
-        self.camera.reload_camera(s)
-        self.camera.start()
+        if int(s) == self.camera.CameraID:
+            self.camera.switchCamera(int(s))
+        else:
+            self.captureManager.switch(self.camera.CameraID, int(s))
 
     def Capture(self):
         # self.logger.debug(f"{sys._getframe().f_code.co_name}")
@@ -400,19 +472,157 @@ class MainUI(QMainWindow):
 
     def Rec(self):
         self.logger.debug(f"{sys._getframe().f_code.co_name}")
+        if self.camera.recorder is not None:
+            self.camera.stopRecording()
+            self.ui.pushButton_CameraRecord.setText("Rec")
+            return
+        record = self.Settings.settings.get("Record", {})
+        try:
+            path = self.camera.startRecording(record.get("codec", "mp4v"), record.get("container", "mp4"),
+                                              record.get("queue", 30), record.get("drop", "oldest"),
+                                              record.get("timestamp", True))
+        except (IOError, ValueError) as e:
+            self.logger.error(f"Recording failed: {e}")
+            return
+        self.ui.pushButton_CameraRecord.setText("Stop")
+        self.showMessage(f"Recording: {path}")
+
+    def SaveReplay(self):
+        record = self.Settings.settings.get("Record", {})
+        path = self.camera.dumpReplay(codec=record.get("codec", "mp4v"), container=record.get("container", "mp4"))
+        if path is not None:
+            self.showMessage(f"Saving replay: {path}")
+
+    def ToggleTrace(self, checked):
+        if not checked:
+            self.ser.stopTrace()
+            return
+        directory = self.Settings.settings.get("Trace", {}).get("dir", "Traces")
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + ".vctrace")
+        try:
+            self.ser.startTrace(path)
+        except OSError as e:
+            self.logger.error(f"Input trace failed: {e}")
+            self.actionTrace.setChecked(False)
+            return
+        self.showMessage(f"Tracing inputs: {path}")
+
+    def ToggleRecordInputs(self, checked):
+        if not checked:
+            if self.inputRecorder is not None:
+                count = self.inputRecorder.stop()
+                self.showMessage(f"Recorded {count} inputs: {self.inputRecorder.path}")
+                self.inputRecorder = None
+                if self.keyPress is not None:
+                    self.keyPress.recorder = None
+            return
+        directory = self.Settings.settings.get("Trace", {}).get("dir", "Traces")
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        filename = "input_" + datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + ".vctrace"
+        path = os.path.join(directory, filename)
+        try:
+            self.inputRecorder = InputRecorder(path)
+        except OSError as e:
+            self.logger.error(f"Input recording failed: {e}")
+            self.actionRecordInputs.setChecked(False)
+            return
+        if self.keyPress is not None:
+            self.keyPress.recorder = self.inputRecorder
+        self.showMessage(f"Recording inputs: {path}")
+
+    def ReplayInputs(self):
+        if self.commandWorker is not None:
+            self.logger.warning("A command is already running.")
+            return
+        if self.keyPress is None:
+            self.logger.error("Serial port is not connected.")
+            return
+        directory = self.Settings.settings.get("Trace", {}).get("dir", "Traces")
+        path, _ = QFileDialog.getOpenFileName(self, "Replay Inputs", directory, "Input trace (*.vctrace)")
+        if not path:
+            return
+        options = self.Settings.settings.get("InputReplay", {})
+        try:
+            command = InputReplay.fromFile(self.keyPress, path, options.get("speed", 1.0), options.get("loop", False),
+                                           camera=self.camera, matcher=self.matcher, batch=self.batchMatcher)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Can't replay {path}: {e}")
+            return
+        self.commandWorker = CommandWorker(command)
+        self.commandWorker.finished_signal.connect(self.CommandFinished)
+        self.commandWorker.start()
+        self.ui.pushButton_start.setText("Stop")
+        self.ui.pushButton_pause.setEnabled(True)
+        self.ui.pushButton_reload.setEnabled(False)
 
     def OpenCaptureDir(self):
         self.logger.debug(f"{sys._getframe().f_code.co_name}")
 
     def CommandReload(self):
         self.logger.debug(f"{sys._getframe().f_code.co_name}")
+        current = self.ui.comboBox.currentText()
+        try:
+            names = self.commandLoader.reload()
+        except Exception as e:
+            self.logger.error(f"Failed to load commands: {e}")
+            return
+        self.ui.comboBox.clear()
+        self.ui.comboBox.addItems(names)
+        if current in names:
+            self.ui.comboBox.setCurrentIndex(names.index(current))
 
     def CommandStart(self):
+        if self.commandWorker is not None:
+            # Start button doubles as Stop while a command is running
+            self.commandWorker.command.cancel()
+            return
         if self.ui.tabWidget_Commands.currentIndex() == 0:
             self.logger.debug(f"{sys._getframe().f_code.co_name}_python")
+            name = self.ui.comboBox.currentText()
+            if not name:
+                return
+            if self.keyPress is None:
+                self.logger.error("Serial port is not connected.")
+                return
+            try:
+                command = self.commandLoader.load(name)(self.keyPress, self.camera, self.matcher,
+                                                          self.batchMatcher)
+            except Exception as e:
+                self.logger.error(f"Failed to load command {name}: {e}")
+                return
+            self.commandWorker = CommandWorker(command)
+            self.commandWorker.finished_signal.connect(self.CommandFinished)
+            self.commandWorker.start()
+            self.ui.pushButton_start.setText("Stop")
+            self.ui.pushButton_pause.setEnabled(True)
+            self.ui.pushButton_reload.setEnabled(False)
         elif self.ui.tabWidget_Commands.currentIndex() == 1:
             self.logger.debug(f"{sys._getframe().f_code.co_name}_Mcu")
-        
+
+    def CommandPause(self):
+        if self.commandWorker is None:
+            return
+        command = self.commandWorker.command
+        if command.is_paused:
+            command.resume()
+            self.ui.pushButton_pause.setText("Pause")
+        else:
+            command.pause()
+            self.ui.pushButton_pause.setText("Resume")
+
+    @pyqtSlot(str, bool)
+    def CommandFinished(self, name, ok):
+        self.logger.debug(f"Command finished: {name} ({'done' if ok else 'stopped'})")
+        self.commandWorker.wait()
+        self.commandWorker = None
+        self.ui.pushButton_start.setText("Start")
+        self.ui.pushButton_pause.setText("Pause")
+        self.ui.pushButton_pause.setEnabled(False)
+        self.ui.pushButton_reload.setEnabled(True)
+
     def GUIController(self):
         self.logger.debug(f"{sys._getframe().f_code.co_name}")
 
@@ -435,33 +645,57 @@ class MainUI(QMainWindow):
             if self.ser.openSerial(self.ui.spinBox_COM.text()):
                 self.logger.debug(f"COM Port {self.ui.spinBox_COM.text()} connected successfully.")
                 self.keyPress = KeyPress(self.ser)
+                self.keyPress.recorder = self.inputRecorder
 
 
     @pyqtSlot(str)
     def append_text(self, text):
+        # one insert per batch; LogArea drops its oldest lines beyond maximumBlockCount
         self.ui.LogArea.moveCursor(QTextCursor.End)
         self.ui.LogArea.insertPlainText(text)
 
-    @pyqtSlot(np.ndarray)
-    def update_image(self, cv_img):
-        """Updates the image_label with a new opencv image"""
-        qt_img = self.ConvertCV2Qt(cv_img)
-        self.ui.Camera.setPixmap(qt_img)
-
-    def ConvertCV2Qt(self, cv_img):
-        """Convert from an opencv image to QPixmap"""
-        rgb_image = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        convert_to_Qt_format = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        p = convert_to_Qt_format.scaled(self.disply_width, self.display_height, Qt.KeepAspectRatio)
-        return QPixmap.fromImage(p)
+    @pyqtSlot()
+    def update_image(self):
+        """Updates the image_label with the newest preview image in the camera's mailbox"""
+        item = self.camera.mailbox.take()
+        if item is None:
+            return
+        slot, seq, timestamp = item
+        if not self.camera.frames.isCurrent(slot, seq):
+            # already overwritten by a newer frame
+            self.camera.mailbox.markDropped()
+            return
+        qt_img, _buffer = self.camera.preview.image(slot)
+        pixmap = QPixmap.fromImage(qt_img)
+        if not self.camera.frames.isCurrent(slot, seq):
+            # the slot was reused while converting, so the image may be torn
+            self.camera.mailbox.markDropped()
+            return
+        self.ui.Camera.setPixmap(pixmap)
+        self.camera.mailbox.markDisplayed()
+        latency.record(CAPTURE_DISPLAY, time.perf_counter() - timestamp)
+
+    @pyqtSlot(float, float, float)
+    def update_frame_stats(self, fps, jitter_mean, jitter_max):
+        counters = self.camera.mailbox.counters()
+        display = latency.histogram(CAPTURE_DISPLAY)
+        self.showMessage(f"Camera: {fps:.1f} fps (jitter mean {jitter_mean:.2f} ms, max {jitter_max:.2f} ms), "
+                         f"displayed {counters['displayed']}, dropped {counters['dropped']}, "
+                         f"display latency p90 <= {display.percentile(90):g} ms")
 
     def closeEvent(self, event):
         confirmObject = QMessageBox.question(self, 'Message', 'Are you sure to quit?', QMessageBox.Ok,
                                              QMessageBox.Cancel)
         if confirmObject == QMessageBox.Ok:
-            self.camera.kill()
+            if self.commandWorker is not None:
+                self.commandWorker.command.cancel()
+                self.commandWorker.wait()
+            self.batchMatcher.close()
+            # closes every camera's capture writer as well
+            self.captureManager.stopAll()
+            self.ser.stopTrace()
+            self.actionRecordInputs.setChecked(False)
+            latency.log()
             self.Settings.SaveSettings(self.ui)
             event.accept()
         else:
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules live at the top of the repository, next to VController.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Camera and Command import PyQt5; no display is needed for what the tests use
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
@@ -0,0 +1,171 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from Camera import CaptureManager, FrameRing, VideoThread, probeModes
+
+
+class FakeCapture:
+    """
+    cv2.VideoCapture stand-in: grants only the listed sizes and delivers frames at
+    the requested fps times the speed of the fourcc.
+    """
+    SIZES = [(640, 360), (1280, 720)]
+    SPEED = {"MJPG": 1.5, "YUY2": 0.25}
+
+    def __init__(self, opened=True):
+        self.opened = opened
+        self.props = {cv2.CAP_PROP_FOURCC: cv2.VideoWriter_fourcc(*"YUY2"),
+                      cv2.CAP_PROP_FRAME_WIDTH: 640, cv2.CAP_PROP_FRAME_HEIGHT: 360,
+                      cv2.CAP_PROP_FPS: 30}
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        self.props[prop] = value
+        if prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT):
+            requested = (self.props[cv2.CAP_PROP_FRAME_WIDTH], self.props[cv2.CAP_PROP_FRAME_HEIGHT])
+            if requested not in self.SIZES:
+                width, height = self.SIZES[-1]
+                self.props[cv2.CAP_PROP_FRAME_WIDTH] = width
+                self.props[cv2.CAP_PROP_FRAME_HEIGHT] = height
+        return True
+
+    def get(self, prop):
+        return self.props[prop]
+
+    def grab(self):
+        fourcc = "".join(chr((int(self.props[cv2.CAP_PROP_FOURCC]) >> (8 * i)) & 0xFF) for i in range(4))
+        time.sleep(1 / (self.props[cv2.CAP_PROP_FPS] * self.SPEED[fourcc]))
+        return True
+
+    def release(self):
+        self.opened = False
+
+
+def test_probe_modes_picks_the_fastest_mode_that_is_granted_and_reached():
+    modes = [("MJPG", 1280, 720, 100), ("MJPG", 640, 360, 200),
+             ("YUY2", 640, 360, 200), ("MJPG", 1920, 1080, 400)]
+    best, results = probeModes(0, modes, frames=10, factory=lambda source, api: FakeCapture())
+    assert best == ("MJPG", 640, 360, 200)
+    assert [r["mode"] for r in results] == modes
+    assert results[0]["granted"]["fourcc"] == "MJPG"
+    assert (results[3]["granted"]["width"], results[3]["granted"]["height"]) == (1280, 720)
+    assert results[2]["measured_fps"] < 0.9 * 200
+
+
+def test_probe_modes_without_a_usable_mode():
+    best, results = probeModes(0, [("YUY2", 640, 360, 200)], frames=5, factory=lambda source, api: FakeCapture())
+    assert best is None
+    assert len(results) == 1
+    best, results = probeModes(0, [("MJPG", 640, 360, 60)], factory=lambda source, api: FakeCapture(opened=False))
+    assert best is None
+    assert results == []
+
+
+def test_frame_ring_snapshot_is_a_copy():
+    ring = FrameRing(2, (4, 4, 3))
+    assert ring.snapshot() == (-1, None, None)
+    slot, buffer = ring.writable()
+    buffer[:] = 1
+    seq = ring.commit(slot, 12.5)
+    got_seq, frame, timestamp = ring.snapshot()
+    assert (got_seq, timestamp) == (seq, 12.5)
+    buffer[:] = 2
+    assert np.all(frame == 1)
+    _, crop, _ = ring.snapshot(lambda f: f[:2, :2])
+    assert crop.shape == (2, 2, 3)
+
+
+def test_frame_ring_writable_invalidates_the_slot():
+    ring = FrameRing(1, (2, 2))
+    slot, _ = ring.writable()
+    seq = ring.commit(slot)
+    assert ring.get(slot, seq) is not None
+    ring.writable()
+    assert not ring.isCurrent(slot, seq)
+    assert ring.get(slot, seq) is None
+
+
+class WedgedCamera:
+    """Camera whose read() hangs in the driver until unblocked."""
+
+    def __init__(self):
+        self.reading = threading.Event()
+        self.unblock = threading.Event()
+        self.released = False
+
+    def isOpened(self):
+        return not self.released
+
+    def read(self, image=None):
+        self.reading.set()
+        self.unblock.wait(5)
+        return False, None
+
+    def release(self):
+        self.released = True
+
+
+def test_a_wedged_read_blocks_neither_swap_nor_kill():
+    thread = VideoThread(30, 0)
+    wedged = WedgedCamera()
+    thread.camera = wedged
+    thread.start()
+    assert wedged.reading.wait(2)
+
+    t = time.perf_counter()
+    thread.pause()
+    thread.resume()
+    thread.set_fps(60)
+    replacement = WedgedCamera()
+    assert thread.swapCamera(replacement, 1, thread.open_generation)
+    thread.kill(timeout=100)
+    assert time.perf_counter() - t < 0.5
+    # the camera being read is released by the capture thread once its read returns
+    assert not wedged.released
+
+    wedged.unblock.set()
+    assert thread.wait(2000)
+    assert wedged.released and replacement.released
+
+
+def test_reload_reopens_a_device_that_refuses_a_second_handle():
+    thread = VideoThread(30, 0)
+    current = FakeCapture()
+    thread.camera = current
+
+    def openCamera(CID):
+        # like DirectShow / V4L2: the device can't be opened twice
+        return None if current.opened else FakeCapture()
+
+    thread.openCamera = openCamera
+    result = []
+    thread.switchCamera(0, result.append).join(2)
+    assert result == [True]
+    assert current.opened is False
+    assert thread.camera is not current and thread.camera.isOpened()
+
+
+def test_only_the_preview_camera_prepares_preview_images():
+    manager = CaptureManager()
+    shown = manager.add("synthetic:64x48", preview=True)
+    extra = manager.add("synthetic:32x24")
+    deadline = time.perf_counter() + 2
+    while (manager.bus.latest("synthetic:32x24") is None or shown.mailbox.counters()["posted"] == 0) \
+            and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    try:
+        assert manager.bus.latest("synthetic:32x24") is not None
+        assert shown.mailbox.counters()["posted"] > 0
+        assert extra.preview is None
+        assert extra.mailbox.counters()["posted"] == 0
+    finally:
+        manager.stopAll()
+    # removing a camera shuts its capture writer down
+    with pytest.raises(RuntimeError):
+        extra.captureWriter.pool.submit(print)
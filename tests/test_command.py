@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from Command import PythonCommand, StopCommand
+from Keys import KeyPress, Button
+
+
+class RecordingSender:
+    """Sender stand-in that keeps every row."""
+    is_binary = False
+
+    def __init__(self):
+        self.rows = []
+
+    def writeRow(self, row, cause=None):
+        self.rows.append(row)
+
+
+@pytest.fixture
+def command():
+    command = PythonCommand(KeyPress(RecordingSender()))
+    yield command
+    command.close()
+
+
+def test_cancelled_command_sends_nothing_more(command):
+    command.press(Button.A, duration=0.01, wait=0.01)
+    rows = list(command.keyPress.ser.rows)
+    command.cancel()
+    with pytest.raises(StopCommand):
+        command.press(Button.B, duration=0.01, wait=0.01)
+    assert command.keyPress.ser.rows == rows
+
+
+def test_pause_releases_and_restores_held_inputs(command):
+    command.hold(Button.A, wait=0)
+    command.pause()
+    resumer = threading.Timer(0.05, command.resume)
+    resumer.start()
+    t = time.perf_counter()
+    command.wait(0.01)
+    assert time.perf_counter() - t >= 0.05
+    rows = command.keyPress.ser.rows
+    # held A, neutral for the pause, A again
+    assert rows[-3:] == ["0x0010 8", "0x0003 8 80 80 80 80", "0x0013 8 80 80 80 80"]
+
+
+def test_key_press_is_serialised():
+    keys = KeyPress(RecordingSender())
+    keys.lock.acquire()
+    pressed = threading.Thread(target=keys.input, args=(Button.A,))
+    pressed.start()
+    time.sleep(0.05)
+    # the GUI thread holds the lock: the command's input waits for it
+    assert keys.ser.rows == []
+    keys.lock.release()
+    pressed.join(1)
+    assert keys.ser.rows == ["0x0010 8"]
@@ -0,0 +1,80 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from FrameSource import ImageSequenceSource, SyntheticSource, isSourceSpec, openSource
+
+
+@pytest.mark.parametrize("spec, expected", [
+    (0, False),
+    ("0", False),
+    ("12", False),
+    ("synthetic", True),
+    ("synthetic:64x48", True),
+    ("Recordings/session.mp4", True),
+])
+def test_is_source_spec(spec, expected):
+    assert isSourceSpec(spec) is expected
+
+
+def test_open_source():
+    source = openSource("synthetic:64x48")
+    assert isinstance(source, SyntheticSource)
+    assert source.size == (64, 48)
+    ret, frame = source.read()
+    assert ret and frame.shape == (48, 64, 3)
+    assert openSource("no/such/file.mp4") is None
+
+
+def test_synthetic_source_delivers_count_frames():
+    source = SyntheticSource((32, 24), realtime=False, count=5)
+    frames = []
+    while True:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(frame)
+    assert len(frames) == 5
+    assert not source.isOpened()
+    # frame i is always the same image
+    assert np.array_equal(frames[3], SyntheticSource((32, 24)).frame(3, None))
+
+
+def test_synthetic_source_loops():
+    source = SyntheticSource((32, 24), count=3, loop=True)
+    image = np.empty((24, 32, 3), np.uint8)
+    for _ in range(7):
+        ret, frame = source.read(image)
+        assert ret and frame is image
+    assert source.get(cv2.CAP_PROP_POS_FRAMES) == 1
+
+
+def test_pacing():
+    assert SyntheticSource(fps=30, speed=10).rate == 300
+    assert SyntheticSource(realtime=True).paced
+    assert not SyntheticSource(realtime=False).paced
+    with pytest.raises(ValueError):
+        SyntheticSource(speed=0)
+    # pacing is VideoThread's job; read() itself never waits, even at 1 fps
+    source = SyntheticSource((32, 24), fps=1, realtime=True)
+    t = time.perf_counter()
+    for _ in range(100):
+        assert source.read()[0]
+    assert time.perf_counter() - t < 0.5
+
+
+def test_image_sequence_source(tmp_path):
+    for i in range(3):
+        cv2.imwrite(str(tmp_path / f"{i:03}.png"), np.full((8, 10, 3), i * 50, np.uint8))
+    (tmp_path / "notes.txt").write_text("not an image")
+    source = openSource(str(tmp_path), realtime=False)
+    assert isinstance(source, ImageSequenceSource)
+    assert source.size == (10, 8)
+    values = [int(source.read()[1][0, 0, 0]) for _ in range(3)]
+    assert values == [0, 50, 100]
+    assert not source.read()[0]
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    assert openSource(str(empty)) is None
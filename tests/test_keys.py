@@ -0,0 +1,131 @@
+import logging
+import math
+
+import pytest
+
+from Keys import (SendFormat, KeyPress, Button, Hat, Stick, Direction, BINARY_FRAME, BINARY_FLAG_END, center,
+                  encode_binary, decode_binary, binary2row)
+
+
+def test_binary_round_trip():
+    frame = encode_binary(bytearray(BINARY_FRAME.size), Button.A << 2 | 0x3, Hat.TOP_RIGHT, 0, 255, 12, 200)
+    fields = decode_binary(frame)
+    assert fields['btn'] == Button.A
+    assert fields['stick_flags'] == 0x3
+    assert fields['hat'] == Hat.TOP_RIGHT
+    assert (fields['lx'], fields['ly'], fields['rx'], fields['ry']) == (0, 255, 12, 200)
+    assert fields['flags'] == 0
+
+
+def test_binary2row_matches_ascii_row():
+    fmt = SendFormat()
+    fmt.setButton([Button.A, Button.ZR])
+    fmt.setHat([Hat.BTM])
+    fmt.setAnyDirection([Direction.UP, Direction.R_LEFT])
+    fmt.L_stick_changed = fmt.R_stick_changed = True
+    row = fmt.convert2str()
+    assert binary2row(fmt.convert2bytes()) == row
+
+
+def test_end_frame():
+    frame = SendFormat().endBytes()
+    assert decode_binary(frame)['flags'] & BINARY_FLAG_END
+    assert binary2row(frame) == 'end'
+
+
+@pytest.mark.parametrize("index", range(1, BINARY_FRAME.size))
+def test_corrupt_frame_is_rejected(index):
+    frame = bytearray(encode_binary(bytearray(BINARY_FRAME.size), 0x13, Hat.CENTER,
+                                    center, center, center, center))
+    frame[index] ^= 0x01
+    with pytest.raises(ValueError):
+        decode_binary(frame)
+
+
+def test_binary_frame_is_smaller_than_a_full_ascii_row():
+    # wire time is proportional to the bytes sent, so this is the speed-up per report
+    fmt = SendFormat()
+    fmt.setButton([Button.A])
+    fmt.setAnyDirection([Direction.UP_RIGHT, Direction.R_UP_LEFT])
+    fmt.L_stick_changed = fmt.R_stick_changed = True
+    ascii_row = (fmt.convert2str() + '\r\n').encode('utf-8')
+    assert len(ascii_row) == 22
+    assert len(fmt.convert2bytes()) == BINARY_FRAME.size == 9
+    assert len(ascii_row) / BINARY_FRAME.size >= 2.4
+
+
+class RecordingSender:
+    """Sender stand-in that keeps every (row, cause)."""
+    is_binary = False
+
+    def __init__(self):
+        self.rows = []
+
+    def writeRow(self, row, cause=None):
+        self.rows.append((row, cause))
+
+
+def test_identical_state_is_not_sent_again():
+    keys = KeyPress(RecordingSender())
+    keys.input(Button.A)
+    keys.input(Button.A)
+    assert keys.ser.rows == [("0x0010 8", None)]
+    assert keys.suppressed == 1
+    keys.send(force=True)
+    assert keys.ser.rows[-1] == ("0x0010 8", None)
+    assert len(keys.ser.rows) == 2
+
+
+def test_pending_cause_survives_a_suppressed_send():
+    keys = KeyPress(RecordingSender())
+    keys.input(Button.A)
+    keys.cause = "frame 7"
+    keys.input(Button.A)
+    assert keys.cause == "frame 7"
+    keys.inputEnd(Button.A)
+    assert keys.ser.rows[-1] == ("0x0000 8", "frame 7")
+    assert keys.cause is None
+
+
+def test_partial_stick_rows_after_a_suppressed_send():
+    keys = KeyPress(RecordingSender())
+    keys.input(Direction.RIGHT)
+    # suppressed; the stick change flags must not leak into the next row
+    keys.input(Direction.RIGHT)
+    keys.input(Button.A)
+    keys.inputEnd(Direction.RIGHT)
+    assert [row for row, _ in keys.ser.rows] == ["0x0002 8 ff 80", "0x0010 8", "0x0012 8 80 80"]
+
+
+def test_whole_degree_full_tilts_are_interned():
+    assert Direction(Stick.LEFT, 90) is Direction(Stick.LEFT, 90)
+    assert Direction(Stick.LEFT, 90) is Direction(Stick.LEFT, 90.0)
+    assert Direction(Stick.LEFT, 90) is not Direction(Stick.RIGHT, 90)
+    assert Direction(Stick.LEFT, 90, showName='UP') is not Direction(Stick.LEFT, 90)
+
+
+@pytest.mark.parametrize("args, kwargs", [
+    ((Stick.LEFT, 90, 0.5), {}),
+    ((Stick.LEFT, 45.5), {}),
+    ((Stick.LEFT, math.pi / 2), {"isDegree": False}),
+    ((Stick.LEFT, 1080), {}),
+])
+def test_other_directions_are_not_interned(args, kwargs):
+    first = Direction(*args, **kwargs)
+    second = Direction(*args, **kwargs)
+    assert first is not second
+    assert (first.x, first.y, first.mag) == (second.x, second.y, second.mag)
+
+
+def test_directions_are_immutable():
+    with pytest.raises(AttributeError):
+        Direction.UP.x = 0
+    with pytest.raises(AttributeError):
+        Direction(Stick.RIGHT, 30, 0.5).mag = 1.0
+    assert Direction.UP.x == Direction(Stick.LEFT, 90).x
+
+
+def test_key_press_adds_one_log_handler():
+    for _ in range(10):
+        KeyPress(RecordingSender())
+    assert len(logging.getLogger('Keys').handlers) == 1
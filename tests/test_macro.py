@@ -0,0 +1,71 @@
+import logging
+import time
+
+import pytest
+
+from Macro import Macro
+
+
+class TimedKeyPress:
+    """KeyPress stand-in that records when each input was sent."""
+
+    def __init__(self):
+        self.events = []
+
+    def input(self, btns):
+        self.events.append(("input", time.perf_counter()))
+
+    def inputEnd(self, btns):
+        self.events.append(("inputEnd", time.perf_counter()))
+
+    def hold(self, btns):
+        self.events.append(("hold", time.perf_counter()))
+
+    def holdEnd(self, btns):
+        self.events.append(("holdEnd", time.perf_counter()))
+
+
+def test_schedule_does_not_drift():
+    macro = Macro(TimedKeyPress())
+    macro.start()
+    start = macro.deadline
+    for _ in range(20):
+        macro.press("A", duration=0.005, wait=0.005)
+    assert macro.elapsed() == pytest.approx(0.2)
+    assert time.perf_counter() - start == pytest.approx(0.2, abs=0.005)
+    assert macro.stats.missed == 0
+
+
+def test_small_lag_is_absorbed_without_shortening_the_press():
+    keys = TimedKeyPress()
+    macro = Macro(keys, max_lag=0.1)
+    macro.start()
+    start = macro.deadline
+    time.sleep(0.03)
+    macro.press("A", duration=0.05, wait=0.05)
+    pressed, released = keys.events[0][1], keys.events[1][1]
+    assert released - pressed >= 0.05
+    # the wait after the press absorbs the lag, so the schedule ends on time
+    assert time.perf_counter() - start == pytest.approx(0.1, abs=0.005)
+    assert macro.stats.missed == 0
+
+
+def test_late_step_re_anchors_the_schedule():
+    keys = TimedKeyPress()
+    macro = Macro(keys, max_lag=0.05)
+    macro.press("A", duration=0.01, wait=0.01)
+    # the caller was busy far longer than max_lag
+    time.sleep(0.15)
+    t = time.perf_counter()
+    macro.press("B", duration=0.03, wait=0.03)
+    pressed, released = keys.events[2][1], keys.events[3][1]
+    assert released - pressed >= 0.03
+    # neither the press nor the wait after it is cut short to catch up
+    assert time.perf_counter() - t == pytest.approx(0.06, abs=0.005)
+    assert macro.stats.missed == 1
+
+
+def test_macros_share_one_log_handler():
+    for _ in range(10):
+        Macro(TimedKeyPress())
+    assert len(logging.getLogger('Macro').handlers) == 1
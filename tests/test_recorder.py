@@ -0,0 +1,54 @@
+import time
+
+import cv2
+import numpy as np
+
+from Camera import VideoThread
+from Recorder import VideoRecorder
+
+
+def frame(value, size=(64, 48)):
+    return np.full((size[1], size[0], 3), value, np.uint8)
+
+
+def test_buffers_are_allocated_only_as_deep_as_the_queue(tmp_path):
+    recorder = VideoRecorder(str(tmp_path / "a.avi"), 30, (64, 48), "MJPG", queue_size=8)
+    # not started: nothing is encoded, so the queue fills up
+    assert recorder.stats()["buffers"] == 0
+    for i in range(10):
+        recorder.put(frame(i))
+    stats = recorder.stats()
+    assert (stats["buffers"], stats["queued"], stats["dropped"]) == (8, 8, 2)
+    recorder.start()
+    recorder.stop()
+
+
+def test_an_encoder_that_keeps_up_reuses_one_buffer(tmp_path):
+    path = str(tmp_path / "b.avi")
+    recorder = VideoRecorder(path, 25, (64, 48), "MJPG", overlay=False)
+    recorder.start()
+    for i in range(5):
+        recorder.put(frame(i * 40))
+        while recorder.stats()["written"] <= i:
+            time.sleep(0.001)
+    stats = recorder.stop()
+    assert (stats["written"], stats["buffers"]) == (5, 1)
+    capture = cv2.VideoCapture(path)
+    assert capture.get(cv2.CAP_PROP_FPS) == 25
+    assert capture.get(cv2.CAP_PROP_FRAME_COUNT) == 5
+    capture.release()
+
+
+def test_recording_uses_the_measured_frame_rate(tmp_path):
+    thread = VideoThread(60, 0, capture_size=(64, 48))
+    thread.record_dir = str(tmp_path)
+    # the device delivers fewer frames than requested
+    thread.frame_stats = (29.97, 0.0, 0.0)
+    thread.startRecording("MJPG", "avi")
+    assert thread.recorder.fps == 29.97
+    thread.stopRecording()
+    # nothing measured yet: the requested rate
+    thread.frame_stats = (0.0, 0.0, 0.0)
+    thread.startRecording("MJPG", "avi")
+    assert thread.recorder.fps == 60
+    thread.stopRecording()
@@ -0,0 +1,36 @@
+import math
+import time
+
+import Scheduler
+from Scheduler import FrameScheduler, sleep_until
+
+
+def test_sleep_until_is_not_late():
+    for _ in range(5):
+        deadline = time.perf_counter() + 0.005
+        assert sleep_until(deadline) < 0.004
+        assert time.perf_counter() >= deadline
+
+
+def test_sleep_until_compensates_for_a_coarse_os_timer(monkeypatch):
+    sleep = time.sleep
+
+    def coarse_sleep(seconds):
+        # like time.sleep on Windows before Python 3.11: wakes on the next 10 ms tick
+        sleep(math.ceil(seconds / 0.01) * 0.01)
+
+    monkeypatch.setattr(Scheduler, "_oversleep", 0.0)
+    monkeypatch.setattr(Scheduler.time, "sleep", coarse_sleep)
+    # the first sleep measures the oversleep
+    sleep_until(time.perf_counter() + 0.025)
+    late = [sleep_until(time.perf_counter() + 0.025) for _ in range(5)]
+    assert max(late) < 0.004
+
+
+def test_frame_scheduler_drops_missed_slots():
+    scheduler = FrameScheduler(200)
+    scheduler.wait()
+    time.sleep(0.03)
+    scheduler.wait()
+    assert scheduler.stats.missed >= 4
+    assert scheduler.wait() < 0.004
@@ -0,0 +1,138 @@
+import threading
+import time
+from logging import getLogger
+
+import pytest
+
+from Keys import KeyPress, Direction, BINARY_FRAME, decode_binary, center
+from Sender import Sender, SerialWriter
+
+
+class BlockingPort:
+    """Serial stand-in whose write() blocks until released."""
+    baudrate = 115200
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.writes = []
+
+    def write(self, data):
+        self.release.wait()
+        self.writes.append(bytes(data))
+
+
+def ascii_row(row):
+    return (row + '\r\n').encode('utf-8'), SerialWriter.stateKey(row)
+
+
+def test_rows_queued_behind_a_write_are_sent_in_one_write():
+    port = BlockingPort()
+    writer = SerialWriter(port, getLogger(__name__))
+    writer.start()
+    writer.put(*ascii_row("0x0013 8 80 80 80 80"))
+    deadline = time.perf_counter() + 2
+    while writer.stats()["depth"] and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    # the first write is blocked; these pile up behind it
+    rows = [f"0x{i << 2:04x} 8" for i in range(1, 6)]
+    for row in rows:
+        writer.put(*ascii_row(row))
+    port.release.set()
+    writer.stop()
+    assert port.writes[1:] == [b"".join(ascii_row(row)[0] for row in rows)]
+    assert writer.stats()["written"] == 6
+    assert writer.stats()["writes"] == 2
+
+
+def test_put_never_blocks_on_a_stalled_port():
+    port = BlockingPort()
+    writer = SerialWriter(port, getLogger(__name__), maxsize=8)
+    writer.start()
+    writer.put(*ascii_row("0x0013 8 80 80 80 80"))
+    deadline = time.perf_counter() + 2
+    while writer.stats()["depth"] and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    t = time.perf_counter()
+    for i in range(100):
+        # alternating buttons, so nothing can be coalesced
+        writer.put(*ascii_row(f"0x{(i % 2) << 2:04x} 8"))
+    assert time.perf_counter() - t < 0.5
+    stats = writer.stats()
+    assert stats["depth"] == 8
+    assert stats["dropped"] == 100 - 8
+    port.release.set()
+    writer.stop()
+
+
+def test_state_keys():
+    assert SerialWriter.stateKey("0x0004 8") == ("0x0004", "8", None, None)
+    assert SerialWriter.stateKey("0x0006 8 80 80") == ("0x0006", "8", False, None)
+    assert SerialWriter.stateKey("0x0007 8 80 80 ff 80") == ("0x0007", "8", False, True)
+    assert SerialWriter.stateKey("end") is None
+    # tilting and centring a stick are edges, moving a tilted stick is not
+    assert SerialWriter.stateKey("0x0006 8 ff 80") != SerialWriter.stateKey("0x0006 8 80 80")
+    assert SerialWriter.stateKey("0x0006 8 ff 80") == SerialWriter.stateKey("0x0006 8 ff 70")
+    # the same buttons with a different stick set must not replace each other
+    assert SerialWriter.stateKey("0x0006 8 80 80") != SerialWriter.stateKey("0x0005 8 80 80")
+
+
+def test_superseded_partial_stick_rows_are_coalesced():
+    port = BlockingPort()
+    writer = SerialWriter(port, getLogger(__name__))
+    writer.start()
+    writer.put(*ascii_row("0x0000 8"))
+    deadline = time.perf_counter() + 2
+    while writer.stats()["depth"] and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    # a tilted stick moving around; centring it would be an edge
+    for x in range(0x81, 0x90):
+        writer.put(*ascii_row(f"0x0006 8 {x:x} 80"))
+    assert writer.stats()["coalesced"] == 14
+    port.release.set()
+    writer.stop()
+    assert port.writes[-1] == b"0x0006 8 8f 80\r\n"
+
+
+def in_flight(writer, row="0x0013 8 80 80 80 80"):
+    """Put a row and wait until the writer thread is blocked writing it."""
+    writer.put(*ascii_row(row))
+    deadline = time.perf_counter() + 2
+    while writer.stats()["depth"] and time.perf_counter() < deadline:
+        time.sleep(0.001)
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_stick_tap_behind_a_write_is_not_coalesced(binary):
+    port = BlockingPort()
+    sender = Sender(False, is_binary=binary)
+    sender.ser = port
+    sender.writer = writer = SerialWriter(port, getLogger(__name__))
+    writer.start()
+    in_flight(writer)
+    keys = KeyPress(sender)
+    keys.input(Direction.RIGHT)
+    keys.inputEnd(Direction.RIGHT)
+    port.release.set()
+    writer.stop()
+    assert writer.stats()["coalesced"] == 0
+    rows = port.writes[1]
+    if binary:
+        frames = [rows[i:i + BINARY_FRAME.size] for i in range(0, len(rows), BINARY_FRAME.size)]
+        assert [decode_binary(frame)['lx'] for frame in frames] == [255, center]
+    else:
+        assert rows == b"0x0002 8 ff 80\r\n0x0002 8 80 80\r\n"
+
+
+def test_dropped_partial_row_keeps_its_sticks():
+    port = BlockingPort()
+    writer = SerialWriter(port, getLogger(__name__), maxsize=2)
+    writer.start()
+    in_flight(writer)
+    writer.put(*ascii_row("0x0006 8 ff 80"))
+    writer.put(*ascii_row("0x0004 8"))
+    # the full queue drops the left stick row; its stick values move into the next row
+    writer.put(*ascii_row("0x0000 8"))
+    port.release.set()
+    writer.stop()
+    assert writer.stats()["dropped"] == 1
+    assert port.writes[1] == b"0x0006 8 ff 80\r\n0x0000 8\r\n"
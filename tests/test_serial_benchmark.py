@@ -0,0 +1,44 @@
+import os
+import time
+
+import pytest
+import serial
+
+from SerialBenchmark import Loopback, benchmark, probe_baudrates, sample_reports
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason="the loopback is a pty")
+
+
+@pytest.fixture
+def port():
+    loopback = Loopback()
+    ser = serial.Serial(loopback.name, 115200, write_timeout=5)
+    yield ser, loopback
+    ser.close()
+    loopback.close()
+
+
+def test_probe_baudrates(port):
+    ser, _ = port
+    assert probe_baudrates(ser, (9600, 115200)) == [9600, 115200]
+    assert ser.baudrate == 115200
+
+
+@pytest.mark.parametrize("binary", [False, True])
+@pytest.mark.parametrize("batch", [1, 8])
+def test_benchmark_writes_every_report(port, binary, batch):
+    ser, loopback = port
+    result = benchmark(ser, 115200, reports=40, binary=binary, batch=batch)
+    expected = sum(len(row) for row in sample_reports(40, binary))
+    deadline = time.perf_counter() + 2
+    while loopback.received < expected and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert loopback.received == expected
+    assert result["bytes_per_report"] == expected / 40
+    assert result["batch"] == batch
+    assert result["latency_theoretical"] == pytest.approx(expected / 40 * 10 / 115200)
+
+
+def test_benchmark_without_reports(port):
+    ser, _ = port
+    assert benchmark(ser, 115200, reports=0) is None
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from Keys import SendFormat, Button, Hat, Direction, BINARY_FLAG_END, center
+from Trace import TRACE_HEADER, TRACE_RECORD, TraceWriter, readTrace, renderPress
+
+
+def binary_row(buttons=(), hat=None, directions=()):
+    fmt = SendFormat()
+    fmt.setButton(list(buttons))
+    if hat is not None:
+        fmt.setHat([hat])
+    if directions:
+        fmt.setAnyDirection(list(directions))
+    return fmt.convert2bytes()
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "inputs.vctrace")
+    # a small chunk makes the writer grow the mapping several times
+    writer = TraceWriter(path, chunk=2)
+    t0 = writer.start
+    writer.writeRow("0x0013 8 10 20 30 40", t0 + 0.1)
+    # only the left stick: the right stick keeps its previous value
+    writer.writeRow("0x0006 2 50 60", t0 + 0.2)
+    writer.writeRow("0x0000 8", t0 + 0.3)
+    writer.writeRow(binary_row([Button.A], Hat.TOP), t0 + 0.4)
+    writer.write(Button.B, Hat.LEFT, 1, 2, 3, 4, timestamp=t0 + 0.5)
+    writer.writeRow('end', t0 + 0.6)
+    writer.close()
+
+    assert os.path.getsize(path) == TRACE_HEADER.size + 6 * TRACE_RECORD.size
+    header, records = readTrace(path)
+    assert header["count"] == 6
+    assert [round(r.time, 6) for r in records] == [0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
+    assert records[0][1:] == (0x0013 >> 2, 8, 0, 0x10, 0x20, 0x30, 0x40)
+    assert records[1][1:] == (0x0006 >> 2, 2, 0, 0x50, 0x60, 0x30, 0x40)
+    assert records[2][1:] == (0, 8, 0, 0x50, 0x60, 0x30, 0x40)
+    assert records[3][1:] == (Button.A, Hat.TOP, 0, center, center, center, center)
+    assert records[4][1:] == (Button.B, Hat.LEFT, 0, 1, 2, 3, 4)
+    assert records[5].flags & BINARY_FLAG_END
+    # writes after close are ignored
+    writer.write(0, Hat.CENTER, center, center, center, center)
+
+
+@pytest.mark.parametrize("flush", [False, True])
+def test_unclosed_trace_is_readable(tmp_path, flush):
+    path = str(tmp_path / "crashed.vctrace")
+    writer = TraceWriter(path, chunk=16)
+    for i in range(3):
+        writer.write(Button.A if i % 2 == 0 else 0, Hat.CENTER, center, center, center, center,
+                     timestamp=writer.start + i + 1)
+    if flush:
+        writer.flush()
+    _, records = readTrace(path)
+    assert [r.time for r in records] == [1.0, 2.0, 3.0]
+    writer.close()
+
+
+def test_not_a_trace(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"\0" * TRACE_HEADER.size)
+    with pytest.raises(ValueError):
+        readTrace(str(path))
+
+
+def test_render_press(tmp_path):
+    path = str(tmp_path / "press.vctrace")
+    writer = TraceWriter(path)
+    t0 = writer.start
+    writer.writeRow("0x0000 8", t0)
+    writer.writeRow(binary_row([Button.A]), t0 + 0.1)
+    writer.writeRow(binary_row(), t0 + 0.2)
+    writer.writeRow(binary_row(directions=[Direction.UP]), t0 + 0.5)
+    writer.writeRow(binary_row(), t0 + 1.5)
+    writer.writeRow('end', t0 + 1.6)
+    writer.close()
+
+    _, records = readTrace(path)
+    assert renderPress(records) == [
+        "self.wait(0.100)",
+        "self.press([Button.A], duration=0.100, wait=0.300)",
+        "self.press([Direction.UP], duration=1.000, wait=0.000)",
+    ]